@@ -1,12 +1,17 @@
+import asyncio
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Dict, FrozenSet, Optional, List
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models import TokenData, User, UserWithRole
-from database import connect
+from cache import TTLCache
+from database import acquire, get_db
+from pubsub import dispatch, notify, subscribe
 
 # Security configurations
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
@@ -16,6 +21,37 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# bcrypt is deliberately slow (~250 ms) and releases the GIL, so it runs in a
+# small dedicated pool instead of on the event loop. Beyond
+# PASSWORD_HASH_MAX_PENDING queued or running hashes, requests get a 503.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+PASSWORD_HASH_RETRY_AFTER = 1
+
+# Users and role permissions read on every authenticated request are cached
+# for AUTH_CACHE_TTL seconds; writes invalidate them in every worker
+# through NOTIFY on AUTH_CHANNEL
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CHANNEL = "auth_changes"
+
+# email -> user row with role names; role_id -> frozenset of permission names
+user_cache = TTLCache(AUTH_CACHE_TTL)
+role_permissions_cache = TTLCache(AUTH_CACHE_TTL)
+
+# Opt-in stateless tokens carry the user's role and permissions, so requests
+# are authorized without a lookup while the token's perm_version is current
+STATELESS_TOKENS = os.getenv("STATELESS_TOKENS", "false").lower() in ("1", "true")
+
+# Latest auth_state.perm_version seen by this worker (None: read it again)
+perm_version: Optional[int] = None
+# permission id -> name; permissions only change through migrations
+permission_catalog: Optional[Dict[int, str]] = None
+
+hash_executor = ThreadPoolExecutor(
+    max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+pending_hashes = 0
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -27,6 +63,34 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def run_password_hash(func, *args):
+    """Run a bcrypt call in the hashing pool, shedding load when it is full."""
+    global pending_hashes
+    if pending_hashes >= PASSWORD_HASH_MAX_PENDING:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many authentication requests, please retry",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+        )
+
+    pending_hashes += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(hash_executor, func, *args)
+    finally:
+        pending_hashes -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash without blocking the event loop."""
+    return await run_password_hash(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password without blocking the event loop."""
+    return await run_password_hash(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -39,31 +103,61 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
-async def get_user_by_email(email: str) -> Optional[dict]:
+async def get_user_by_email(email: str, conn=None) -> Optional[dict]:
     """Get user by email from database."""
-    conn = await connect()
-    try:
-        result = await conn.fetchrow(
-            """
-            SELECT u.id, u.email, u.nom, u.prenom, u.hashed_password, u.is_active, 
-                   u.role_id, u.created_at, u.updated_at
-            FROM users u 
-            WHERE u.email = $1
-            """,
-            email,
-        )
-        return dict(result) if result else None
-    finally:
-        await conn.close()
+    if conn is None:
+        async with acquire() as conn:
+            return await get_user_by_email(email, conn)
+
+    result = await conn.fetchrow(
+        """
+        SELECT u.id, u.email, u.nom, u.prenom, u.hashed_password, u.is_active, 
+               u.role_id, u.created_at, u.updated_at
+        FROM users u 
+        WHERE u.email = $1
+        """,
+        email,
+    )
+    return dict(result) if result else None
+
+
+async def get_role_permissions(role_id: int, conn=None) -> FrozenSet[str]:
+    """Get the names of a role's permissions (cached)."""
+    permissions = role_permissions_cache.get(role_id)
+    if permissions is not None:
+        return permissions
+
+    if conn is None:
+        async with acquire() as conn:
+            return await get_role_permissions(role_id, conn)
+
+    generation = role_permissions_cache.generation
+    rows = await conn.fetch(
+        """
+        SELECT p.name 
+        FROM permissions p
+        JOIN role_permissions rp ON p.id = rp.permission_id
+        WHERE rp.role_id = $1
+        """,
+        role_id,
+    )
+    permissions = frozenset(row["name"] for row in rows)
+    role_permissions_cache.set(role_id, permissions, generation)
+    return permissions
 
 
-async def get_user_with_role(email: str) -> Optional[dict]:
-    """Get user with role and permissions from database."""
-    conn = await connect()
-    try:
+async def get_user_with_role(email: str, conn=None) -> Optional[dict]:
+    """Get user with role and permissions (cached)."""
+    user = user_cache.get(email)
+    if user is None:
+        if conn is None:
+            async with acquire() as conn:
+                return await get_user_with_role(email, conn)
+
+        generation = user_cache.generation
         result = await conn.fetchrow(
             """
-            SELECT u.id, u.email, u.nom, u.prenom, u.hashed_password, u.is_active, 
+            SELECT u.id, u.email, u.nom, u.prenom, u.is_active, 
                    u.role_id, u.created_at, u.updated_at, r.name as role_name, 
                    r.display_name as role_display_name
             FROM users u 
@@ -72,41 +166,182 @@ async def get_user_with_role(email: str) -> Optional[dict]:
             """,
             email,
         )
-
         if not result:
             return None
+        user = dict(result)
+        user_cache.set(email, user, generation)
 
-        user_data = dict(result)
+    permissions = await get_role_permissions(user["role_id"], conn)
+    return {**user, "permissions": sorted(permissions)}
 
-        # Get user permissions
-        permissions = await conn.fetch(
-            """
-            SELECT p.name 
-            FROM permissions p
-            JOIN role_permissions rp ON p.id = rp.permission_id
-            WHERE rp.role_id = $1
-            """,
-            user_data["role_id"],
-        )
 
-        user_data["permissions"] = [perm["name"] for perm in permissions]
-        return user_data
-    finally:
-        await conn.close()
+def forget_users(emails: List[str]):
+    for email in emails:
+        user_cache.invalidate(email)
+
+
+def forget_role(role_id: int):
+    role_permissions_cache.invalidate(role_id)
+    # Cached users carry their role's names
+    user_cache.clear()
+
+
+def note_perm_version(version: int):
+    global perm_version
+    # Notifications and reads can arrive out of order; versions only grow
+    perm_version = max(perm_version or 0, version)
+
+
+def on_auth_change(payload: Optional[str]):
+    global perm_version, permission_catalog
+    if payload is None:
+        user_cache.clear()
+        role_permissions_cache.clear()
+        perm_version = None
+        permission_catalog = None
+        return
+    change = json.loads(payload)
+    if "role_id" in change:
+        forget_role(change["role_id"])
+    if "emails" in change:
+        forget_users(change["emails"])
+    if "perm_version" in change:
+        note_perm_version(change["perm_version"])
 
 
-async def authenticate_user(email: str, password: str) -> Optional[dict]:
-    """Authenticate user with email and password."""
-    user = await get_user_by_email(email)
+subscribe(AUTH_CHANNEL, on_auth_change)
+
+
+async def bump_perm_version(conn) -> int:
+    """Make every stateless token issued so far stale."""
+    version = await conn.fetchval(
+        "UPDATE auth_state SET perm_version = perm_version + 1 RETURNING perm_version"
+    )
+    note_perm_version(version)
+    return version
+
+
+async def announce_auth_change(conn, change: dict):
+    payload = json.dumps(change)
+    # Applied here at once; the other workers get it through NOTIFY
+    dispatch(AUTH_CHANNEL, payload)
+    await notify(conn, AUTH_CHANNEL, payload)
+
+
+async def invalidate_users(conn, *emails: str):
+    """Drop cached user rows in this worker and, via NOTIFY, in the others.
+
+    Call once the change has committed: the new version is applied locally
+    at once, and a login in between would pair it with the old permissions.
+    """
+    version = await bump_perm_version(conn)
+    await announce_auth_change(conn, {"emails": emails, "perm_version": version})
+
+
+async def invalidate_role(conn, role_id: int):
+    """Drop a role's cached permissions in this worker and the others.
+
+    Like invalidate_users, call it after the change has committed.
+    """
+    version = await bump_perm_version(conn)
+    await announce_auth_change(conn, {"role_id": role_id, "perm_version": version})
+
+
+async def get_perm_version(conn=None) -> int:
+    if perm_version is None:
+        if conn is None:
+            async with acquire() as conn:
+                return await get_perm_version(conn)
+        note_perm_version(await conn.fetchval("SELECT perm_version FROM auth_state"))
+    return perm_version
+
+
+async def get_permission_catalog(conn=None) -> Dict[int, str]:
+    global permission_catalog
+    if permission_catalog is None:
+        if conn is None:
+            async with acquire() as conn:
+                return await get_permission_catalog(conn)
+        rows = await conn.fetch("SELECT id, name FROM permissions")
+        permission_catalog = {row["id"]: row["name"] for row in rows}
+    return permission_catalog
+
+
+async def stateless_claims(email: str, conn) -> dict:
+    """Token claims describing a user's role and permissions.
+
+    Permissions are a hex bitmask over permission ids. The version is read
+    before the user, so a change in between leaves the token stale rather
+    than wrong.
+    """
+    version = await get_perm_version(conn)
+    user = await get_user_with_role(email, conn)
+    permission_ids = {
+        name: permission_id
+        for permission_id, name in (await get_permission_catalog(conn)).items()
+    }
+    mask = 0
+    for name in user["permissions"]:
+        mask |= 1 << permission_ids[name]
+
+    return {
+        "uid": user["id"],
+        "nom": user["nom"],
+        "prenom": user["prenom"],
+        "active": user["is_active"],
+        "role_id": user["role_id"],
+        "role": user["role_name"],
+        "role_label": user["role_display_name"],
+        "perms": format(mask, "x"),
+        "pv": version,
+    }
+
+
+async def user_from_claims(payload: dict, conn=None) -> Optional[dict]:
+    """Rebuild the user from stateless claims; None if they are stale.
+
+    Once this worker knows the perm_version and the permission catalog, no
+    connection is needed.
+    """
+    if payload.get("pv") != await get_perm_version(conn):
+        return None
+
+    mask = int(payload["perms"], 16)
+    catalog = await get_permission_catalog(conn)
+    return {
+        "id": payload["uid"],
+        "email": payload["sub"],
+        "nom": payload["nom"],
+        "prenom": payload["prenom"],
+        "is_active": payload["active"],
+        "role_id": payload["role_id"],
+        "role_name": payload["role"],
+        "role_display_name": payload["role_label"],
+        "permissions": sorted(
+            name for permission_id, name in catalog.items() if mask >> permission_id & 1
+        ),
+        "created_at": None,
+        "updated_at": None,
+    }
+
+
+async def authenticate_user(email: str, password: str, conn=None) -> Optional[dict]:
+    """Authenticate user with email and password.
+
+    Without ``conn`` a connection is borrowed only for the lookup, and is
+    back in the pool while the password is verified.
+    """
+    user = await get_user_by_email(email, conn)
     if not user:
         return None
-    if not verify_password(password, user["hashed_password"]):
+    if not await verify_password_async(password, user["hashed_password"]):
         return None
     return user
 
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
+    conn=Depends(get_db),
 ) -> User:
     """Get current user from JWT token."""
     credentials_exception = HTTPException(
@@ -125,7 +360,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
 
-    user = await get_user_by_email(email=token_data.email)
+    user = await get_user_by_email(email=token_data.email, conn=conn)
     if user is None:
         raise credentials_exception
 
@@ -161,7 +396,14 @@ async def get_current_user_with_role(
     except JWTError:
         raise credentials_exception
 
-    user = await get_user_with_role(email=token_data.email)
+    # Claims are only trusted when issued under the current perm_version;
+    # otherwise the user is read from the database (or its cache). Either way
+    # a connection is only borrowed on a cache miss.
+    user = None
+    if STATELESS_TOKENS and "pv" in payload:
+        user = await user_from_claims(payload)
+    if user is None:
+        user = await get_user_with_role(email=token_data.email)
     if user is None:
         raise credentials_exception
 
@@ -246,21 +488,21 @@ def require_role(role_name: str):
     return role_check
 
 
-async def check_user_permission(user_id: int, permission: str) -> bool:
+async def check_user_permission(user_id: int, permission: str, conn=None) -> bool:
     """Check if a user has a specific permission."""
-    conn = await connect()
-    try:
-        result = await conn.fetchrow(
-            """
-            SELECT COUNT(*) as count
-            FROM users u
-            JOIN role_permissions rp ON u.role_id = rp.role_id
-            JOIN permissions p ON rp.permission_id = p.id
-            WHERE u.id = $1 AND p.name = $2 AND u.is_active = TRUE
-            """,
-            user_id,
-            permission,
-        )
-        return result["count"] > 0 if result else False
-    finally:
-        await conn.close()
+    if conn is None:
+        async with acquire() as conn:
+            return await check_user_permission(user_id, permission, conn)
+
+    result = await conn.fetchrow(
+        """
+        SELECT COUNT(*) as count
+        FROM users u
+        JOIN role_permissions rp ON u.role_id = rp.role_id
+        JOIN permissions p ON rp.permission_id = p.id
+        WHERE u.id = $1 AND p.name = $2 AND u.is_active = TRUE
+        """,
+        user_id,
+        permission,
+    )
+    return result["count"] > 0 if result else False
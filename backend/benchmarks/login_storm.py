@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Latency of a cheap endpoint while logins hash passwords.
+
+Runs in-process against a minimal app (no database needed): one login route
+verifies bcrypt on the event loop like the old code, the other goes through
+the hashing pool. While concurrent clients log in back to back, /ping is
+polled and its latency percentiles are reported for both.
+
+    python benchmarks/login_storm.py [--clients 20] [--duration 10]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from auth import get_password_hash, verify_password, verify_password_async
+
+PASSWORD = "benchmark-password"
+HASHED = get_password_hash(PASSWORD)
+PING_INTERVAL = 0.01
+
+app = FastAPI()
+
+
+@app.get("/ping")
+async def ping():
+    return {"ok": True}
+
+
+@app.post("/login-blocking")
+async def login_blocking():
+    return {"ok": verify_password(PASSWORD, HASHED)}
+
+
+@app.post("/login")
+async def login():
+    return {"ok": await verify_password_async(PASSWORD, HASHED)}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(login_path: str, clients: int, duration: float) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        deadline = time.perf_counter() + duration
+        statuses = set()
+        latencies = []
+
+        async def log_in_repeatedly():
+            while time.perf_counter() < deadline:
+                response = await c.post(login_path)
+                statuses.add(response.status_code)
+                if response.status_code == 503:
+                    await asyncio.sleep(float(response.headers["Retry-After"]))
+
+        async def ping_repeatedly():
+            # Latency counts from when each ping was due, so time spent
+            # waiting for a blocked loop is included
+            due = time.perf_counter()
+            while due < deadline:
+                await asyncio.sleep(max(0, due - time.perf_counter()))
+                await c.get("/ping")
+                latencies.append((time.perf_counter() - due) * 1000)
+                due += PING_INTERVAL
+
+        await asyncio.gather(
+            ping_repeatedly(), *(log_in_repeatedly() for _ in range(clients))
+        )
+    return {
+        "statuses": sorted(statuses),
+        "pings": len(latencies),
+        "p50": statistics.median(latencies),
+        "p99": percentile(latencies, 99),
+        "max": max(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    for label, path in (("on event loop", "/login-blocking"), ("pool", "/login")):
+        result = asyncio.run(run(path, args.clients, args.duration))
+        print(
+            f"{label:>13}: {result['pings']:4} pings  p50 {result['p50']:7.1f} ms  "
+            f"p99 {result['p99']:7.1f} ms  max {result['max']:7.1f} ms  "
+            f"login statuses {result['statuses']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Time to serve an article list through each JSON path.
+
+Runs in-process against a minimal app (no database needed) that returns the
+same prebuilt asyncpg records two ways: as dicts validated against
+``List[Article]`` like the default routes, and through RecordsResponse
+(FAST_JSON). Each size is requested a few times and the best run is kept.
+
+    python benchmarks/serialize_rows.py [--rows 10000,100000,1000000] [--repeat 3]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from asyncpg.protocol.protocol import _create_record
+from fastapi import FastAPI, Response
+from models import Article
+from responses import records_response
+
+COLUMNS = (
+    "id",
+    "titre",
+    "prix",
+    "unite",
+    "description",
+    "categorie_id",
+    "categorie",
+    "sous_categorie_id",
+    "sous_categorie",
+    "date_rappel",
+    "piece_jointe",
+    "sort_value",
+)
+
+app = FastAPI()
+records = []
+
+
+def make_records(count: int):
+    mapping = {name: i for i, name in enumerate(COLUMNS)}
+    return [
+        _create_record(
+            mapping,
+            (
+                i,
+                f"Article {i}",
+                i * 1.5,
+                "pièce",
+                "Description assez longue pour ressembler à une vraie fiche " * 2,
+                i % 50,
+                f"Catégorie {i % 50}",
+                i % 200,
+                f"Sous-catégorie {i % 200}",
+                "2025-01-01",
+                None,
+                i,
+            ),
+        )
+        for i in range(count)
+    ]
+
+
+@app.get("/pydantic", response_model=List[Article])
+async def list_pydantic():
+    return [dict(r) for r in records]
+
+
+@app.get("/orjson", response_model=List[Article])
+async def list_orjson(response: Response):
+    return records_response(records, response, exclude=("sort_value",))
+
+
+async def best_time(path: str, repeat: int) -> tuple:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await c.get(path)
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            best = elapsed if best is None else min(best, elapsed)
+    return best, len(response.content)
+
+
+def main():
+    global records
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for count in (int(n) for n in args.rows.split(",")):
+        records = make_records(count)
+        slow, size = asyncio.run(best_time("/pydantic", args.repeat))
+        fast, _ = asyncio.run(best_time("/orjson", args.repeat))
+        print(
+            f"{count:>8} rows ({size / 1e6:6.1f} MB): pydantic {slow * 1000:8.1f} ms  "
+            f"orjson {fast * 1000:8.1f} ms  ({slow / fast:4.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
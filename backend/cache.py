@@ -0,0 +1,46 @@
+import time
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """Small in-process cache whose entries expire after ``ttl`` seconds.
+
+    ``generation`` changes on every invalidation. Readers note it before
+    loading from the database and pass it to ``set``, so a value read before
+    a concurrent write is not cached after that write invalidated it.
+    A ``ttl`` of 0 disables caching.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = {}
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            self.entries.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        if self.ttl <= 0:
+            return
+        if generation is not None and generation != self.generation:
+            return
+        if len(self.entries) >= self.max_size and key not in self.entries:
+            # Evict the oldest entry; dicts keep insertion order
+            self.entries.pop(next(iter(self.entries)))
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key: Hashable):
+        self.entries.pop(key, None)
+        self.generation += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.generation += 1
@@ -0,0 +1,104 @@
+import itertools
+import json
+import secrets
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from fastapi import HTTPException, Request, Response
+import pubsub
+from pubsub import DATA_CHANGES_CHANNEL, subscribe
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an entity tag."""
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag.removeprefix("W/")
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+def not_modified_since(if_modified_since: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    return since.tzinfo is not None and int(mtime) <= since.timestamp()
+
+
+# List ETags are built from version markers instead of hashing bodies. Each
+# table records the last change the data_changes feed (or a write handler of
+# this worker) reported for it. Markers only order changes as this worker
+# heard of them, so tags are seeded with a token of its own: a tag from
+# another worker never matches. Lost notifications restart tracking.
+worker_seed = secrets.token_hex(8)
+table_versions: Dict[str, str] = {}
+# Times tracking restarted; part of the seed, so tags never repeat
+resets = 0
+# Marks changes that carry no version: statements too large to list their
+# rows, and writes noted by this worker before their notification arrives
+local_changes = itertools.count(1)
+
+
+def on_data_change(payload: Optional[str]):
+    global resets
+    if payload is None:
+        resets += 1
+        table_versions.clear()
+        return
+
+    change = json.loads(payload)
+    if change["rows"]:
+        marker = str(max(version for _, version in change["rows"]))
+    else:
+        marker = f"n{next(local_changes)}"
+    table_versions[change["table"]] = marker
+
+
+subscribe(DATA_CHANGES_CHANNEL, on_data_change)
+
+
+def note_local_change(*tables: str):
+    """Move the tags of ``tables`` after a write by this worker has committed.
+
+    The write's notification comes back later; a read in between must not
+    be answered with a tag issued before the write.
+    """
+    for table in tables:
+        table_versions[table] = f"n{next(local_changes)}"
+
+
+def current_etag(tables) -> Optional[str]:
+    """Weak ETag of a representation built from ``tables``.
+
+    Returns None while change notifications are not being received, since a
+    write could then go unnoticed.
+    """
+    if pubsub.listen_conn is None:
+        return None
+    markers = "-".join(table_versions.get(table, "0") for table in tables)
+    return f'W/"{worker_seed}.{resets}-{markers}"'
+
+
+def table_etag(*tables: str, private: bool = False):
+    """Dependency factory answering If-None-Match for a read of ``tables``.
+
+    A match raises a 304 before the route queries anything; otherwise the
+    ETag is added to the response. Declare it after any permission check,
+    and pass ``private`` when the response depends on the caller.
+    """
+    cache_control = "private, no-cache" if private else "public, no-cache"
+
+    async def check_etag(request: Request, response: Response):
+        # Read before the route's query, so the tag never runs ahead of data
+        etag = current_etag(tables)
+        if etag is None:
+            return
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if private:
+            headers["Vary"] = "Authorization"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None and etag_matches(if_none_match, etag):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+    return check_etag
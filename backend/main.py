@@ -1,17 +1,25 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from database import init_db
-from routes import articles, categories, sous_categories, auth
+from database import init_db, create_pool, close_pool
+from pagination import NEXT_CURSOR_HEADER
+from pubsub import start_listener, stop_listener
+from storage import UploadSizeLimitMiddleware
+from thumbnails import start_thumbnail_pool, stop_thumbnail_pool
+from routes import articles, categories, sous_categories, auth, events, sync
 
 app = FastAPI()
 origins = ["*"]
 
+# Attachment uploads are refused on their size before the body is read
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/api/articles/"])
+# CORS is added last so it wraps those rejections too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
@@ -20,8 +28,20 @@ app.include_router(categories.router, prefix="/api/categories", tags=["Catégori
 app.include_router(
     sous_categories.router, prefix="/api/sous-categories", tags=["Sous-catégories"]
 )
+app.include_router(events.router, prefix="/api/events", tags=["Events"])
+app.include_router(sync.router, prefix="/api/sync", tags=["Sync"])
 
 
 @app.on_event("startup")
 async def startup():
     await init_db()
+    await create_pool()
+    await start_listener()
+    start_thumbnail_pool()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    stop_thumbnail_pool()
+    await stop_listener()
+    await close_pool()
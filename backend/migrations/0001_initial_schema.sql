@@ -0,0 +1,168 @@
+-- Base schema, default roles and permissions.
+--
+-- Written to be safe on databases created before versioned migrations:
+-- every object is created only if missing and seed rows are only inserted
+-- into empty tables.
+
+CREATE TABLE IF NOT EXISTS roles (
+    id SERIAL PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    display_name TEXT NOT NULL,
+    description TEXT DEFAULT '',
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS permissions (
+    id SERIAL PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    display_name TEXT NOT NULL,
+    description TEXT DEFAULT '',
+    resource TEXT NOT NULL,
+    action TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS role_permissions (
+    id SERIAL PRIMARY KEY,
+    role_id INTEGER REFERENCES roles(id) ON DELETE CASCADE,
+    permission_id INTEGER REFERENCES permissions(id) ON DELETE CASCADE,
+    granted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(role_id, permission_id)
+);
+
+CREATE TABLE IF NOT EXISTS categories (
+    id SERIAL PRIMARY KEY,
+    nom TEXT NOT NULL,
+    description TEXT DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS sous_categories (
+    id SERIAL PRIMARY KEY,
+    nom TEXT NOT NULL,
+    description TEXT DEFAULT '',
+    categorie_id INTEGER NOT NULL REFERENCES categories(id)
+);
+CREATE TABLE IF NOT EXISTS articles (
+    id SERIAL PRIMARY KEY,
+    titre TEXT,
+    prix FLOAT,
+    unite TEXT,
+    description TEXT,
+    categorie_id INTEGER REFERENCES categories(id),
+    sous_categorie_id INTEGER REFERENCES sous_categories(id),
+    date_rappel TEXT,
+    piece_jointe TEXT
+);
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    email TEXT UNIQUE NOT NULL,
+    nom TEXT NOT NULL,
+    prenom TEXT NOT NULL,
+    hashed_password TEXT NOT NULL,
+    role_id INTEGER REFERENCES roles(id) DEFAULT 2,
+    is_active BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Columns added after the first release
+ALTER TABLE users ADD COLUMN IF NOT EXISTS role_id INTEGER REFERENCES roles(id) DEFAULT 2;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS description TEXT DEFAULT '';
+ALTER TABLE sous_categories ADD COLUMN IF NOT EXISTS description TEXT DEFAULT '';
+
+DO $$
+BEGIN
+    -- Default roles
+    IF NOT EXISTS (SELECT 1 FROM roles) THEN
+        INSERT INTO roles (name, display_name, description) VALUES
+        ('super_admin', 'Super Administrateur', 'Accès complet au système avec gestion des utilisateurs et des rôles'),
+        ('admin', 'Administrateur', 'Accès complet aux articles, catégories et gestion d''équipe'),
+        ('manager', 'Gestionnaire', 'Peut gérer les articles et catégories, accès en lecture aux utilisateurs'),
+        ('editor', 'Éditeur', 'Peut créer et modifier des articles, accès en lecture aux catégories'),
+        ('viewer', 'Observateur', 'Accès en lecture seule à tous les contenus'),
+        ('inactive', 'Inactif', 'Compte désactivé, aucun accès');
+    END IF;
+
+    -- Default permissions
+    IF NOT EXISTS (SELECT 1 FROM permissions) THEN
+        INSERT INTO permissions (name, display_name, description, resource, action) VALUES
+        -- Article permissions
+        ('articles.read', 'Lire Articles', 'Voir les articles', 'articles', 'read'),
+        ('articles.create', 'Créer Articles', 'Créer de nouveaux articles', 'articles', 'create'),
+        ('articles.update', 'Modifier Articles', 'Modifier les articles existants', 'articles', 'update'),
+        ('articles.delete', 'Supprimer Articles', 'Supprimer des articles', 'articles', 'delete'),
+        ('articles.export', 'Exporter Articles', 'Exporter les données des articles', 'articles', 'export'),
+
+        -- Category permissions
+        ('categories.read', 'Lire Catégories', 'Voir les catégories', 'categories', 'read'),
+        ('categories.create', 'Créer Catégories', 'Créer de nouvelles catégories', 'categories', 'create'),
+        ('categories.update', 'Modifier Catégories', 'Modifier les catégories existantes', 'categories', 'update'),
+        ('categories.delete', 'Supprimer Catégories', 'Supprimer des catégories', 'categories', 'delete'),
+
+        -- User permissions
+        ('users.read', 'Lire Utilisateurs', 'Voir la liste des utilisateurs', 'users', 'read'),
+        ('users.create', 'Créer Utilisateurs', 'Créer de nouveaux utilisateurs', 'users', 'create'),
+        ('users.update', 'Modifier Utilisateurs', 'Modifier les utilisateurs existants', 'users', 'update'),
+        ('users.delete', 'Supprimer Utilisateurs', 'Supprimer des utilisateurs', 'users', 'delete'),
+
+        -- Role permissions
+        ('roles.read', 'Lire Rôles', 'Voir les rôles et permissions', 'roles', 'read'),
+        ('roles.create', 'Créer Rôles', 'Créer de nouveaux rôles', 'roles', 'create'),
+        ('roles.update', 'Modifier Rôles', 'Modifier les rôles existants', 'roles', 'update'),
+        ('roles.delete', 'Supprimer Rôles', 'Supprimer des rôles', 'roles', 'delete'),
+
+        -- System permissions
+        ('system.admin', 'Administration Système', 'Accès complet au système', 'system', 'admin'),
+        ('system.backup', 'Sauvegarde Système', 'Créer et restaurer des sauvegardes', 'system', 'backup'),
+        ('system.settings', 'Paramètres Système', 'Modifier les paramètres du système', 'system', 'settings');
+    END IF;
+
+    -- Permissions of the default roles
+    IF NOT EXISTS (SELECT 1 FROM role_permissions) THEN
+        -- Super Admin: All permissions
+        INSERT INTO role_permissions (role_id, permission_id)
+        SELECT r.id, p.id FROM roles r, permissions p
+        WHERE r.name = 'super_admin';
+
+        -- Admin: Most permissions except role management
+        INSERT INTO role_permissions (role_id, permission_id)
+        SELECT r.id, p.id FROM roles r, permissions p
+        WHERE r.name = 'admin' AND p.name NOT IN ('roles.create', 'roles.update', 'roles.delete', 'system.admin');
+
+        -- Manager: Article and category management, user read
+        INSERT INTO role_permissions (role_id, permission_id)
+        SELECT r.id, p.id FROM roles r, permissions p
+        WHERE r.name = 'manager' AND p.name IN (
+            'articles.read', 'articles.create', 'articles.update', 'articles.delete', 'articles.export',
+            'categories.read', 'categories.create', 'categories.update', 'categories.delete',
+            'users.read'
+        );
+
+        -- Editor: Article management, category read
+        INSERT INTO role_permissions (role_id, permission_id)
+        SELECT r.id, p.id FROM roles r, permissions p
+        WHERE r.name = 'editor' AND p.name IN (
+            'articles.read', 'articles.create', 'articles.update', 'articles.export',
+            'categories.read'
+        );
+
+        -- Viewer: Read-only access
+        INSERT INTO role_permissions (role_id, permission_id)
+        SELECT r.id, p.id FROM roles r, permissions p
+        WHERE r.name = 'viewer' AND p.name IN (
+            'articles.read', 'categories.read'
+        );
+
+        -- Inactive: No permissions
+    END IF;
+END
+$$;
+
+-- Existing users get the super admin role (first user) or the editor role
+UPDATE users SET role_id = (
+    CASE
+        WHEN id = 1 THEN (SELECT id FROM roles WHERE name = 'super_admin')
+        ELSE (SELECT id FROM roles WHERE name = 'editor')
+    END
+) WHERE role_id IS NULL;
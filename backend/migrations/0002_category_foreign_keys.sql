@@ -0,0 +1,79 @@
+-- Category references used to be free TEXT columns matched against
+-- categories.nom. Databases still on that layout are moved onto integer
+-- foreign keys; names that match no row are created first so no article
+-- loses its classification.
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND ((table_name = 'sous_categories' AND column_name = 'categorie')
+            OR (table_name = 'articles'
+                AND column_name IN ('categorie', 'sous_categorie')))
+    ) THEN
+        ALTER TABLE sous_categories
+            ADD COLUMN IF NOT EXISTS categorie_id INTEGER REFERENCES categories(id);
+        ALTER TABLE articles
+            ADD COLUMN IF NOT EXISTS categorie_id INTEGER REFERENCES categories(id),
+            ADD COLUMN IF NOT EXISTS sous_categorie_id INTEGER
+                REFERENCES sous_categories(id);
+
+        -- Categories only known by name
+        INSERT INTO categories (nom)
+        SELECT DISTINCT ref.nom
+        FROM (
+            SELECT categorie AS nom FROM sous_categories
+            UNION SELECT categorie FROM articles
+        ) ref
+        WHERE ref.nom IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.nom = ref.nom);
+
+        UPDATE sous_categories sc
+        SET categorie_id = (SELECT MIN(c.id) FROM categories c WHERE c.nom = sc.categorie);
+
+        -- Sous-categories only known by name from articles; the old name
+        -- column is dropped below, so rows added here leave it empty
+        ALTER TABLE sous_categories ALTER COLUMN categorie DROP NOT NULL;
+        INSERT INTO sous_categories (nom, categorie_id)
+        SELECT DISTINCT a.sous_categorie, c.id
+        FROM articles a
+        JOIN categories c ON c.nom = a.categorie
+        WHERE a.sous_categorie IS NOT NULL
+          AND c.id = (SELECT MIN(id) FROM categories WHERE nom = a.categorie)
+          AND NOT EXISTS (
+              SELECT 1 FROM sous_categories sc
+              WHERE sc.nom = a.sous_categorie AND sc.categorie_id = c.id
+          );
+
+        UPDATE articles a
+        SET categorie_id = (SELECT MIN(c.id) FROM categories c WHERE c.nom = a.categorie),
+            sous_categorie_id = (
+                SELECT MIN(sc.id)
+                FROM sous_categories sc
+                JOIN categories c ON c.id = sc.categorie_id
+                WHERE sc.nom = a.sous_categorie AND c.nom = a.categorie
+            );
+
+        ALTER TABLE sous_categories ALTER COLUMN categorie_id SET NOT NULL;
+        ALTER TABLE sous_categories DROP COLUMN categorie;
+        ALTER TABLE articles DROP COLUMN categorie, DROP COLUMN sous_categorie;
+    END IF;
+END
+$$;
+
+-- Indexes backing the keyset pagination and filters of list_articles
+CREATE INDEX IF NOT EXISTS idx_articles_titre_id
+    ON articles ((COALESCE(titre, '')), id);
+CREATE INDEX IF NOT EXISTS idx_articles_prix_id
+    ON articles ((COALESCE(prix, 0)), id);
+CREATE INDEX IF NOT EXISTS idx_articles_date_rappel_id
+    ON articles ((COALESCE(date_rappel, '')), id);
+CREATE INDEX IF NOT EXISTS idx_articles_categorie_id
+    ON articles (categorie_id, id);
+CREATE INDEX IF NOT EXISTS idx_articles_sous_categorie_id
+    ON articles (sous_categorie_id, id);
+CREATE INDEX IF NOT EXISTS idx_sous_categories_categorie_id
+    ON sous_categories (categorie_id);
+CREATE INDEX IF NOT EXISTS idx_categories_nom ON categories (nom);
+CREATE INDEX IF NOT EXISTS idx_sous_categories_nom ON sous_categories (nom);
@@ -0,0 +1,39 @@
+-- Sample categories and sous-categories for new installations
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM categories) THEN
+        INSERT INTO categories (nom, description) VALUES
+        ('Alimentaire', 'Produits alimentaires et boissons'),
+        ('Électronique', 'Appareils et composants électroniques'),
+        ('Vêtements', 'Vêtements et accessoires'),
+        ('Maison', 'Articles pour la maison et décoration'),
+        ('Sport', 'Articles de sport et loisirs'),
+        ('Bureautique', 'Fournitures de bureau et papeterie');
+
+        INSERT INTO sous_categories (nom, description, categorie_id)
+        SELECT v.nom, v.description, c.id
+        FROM categories c
+        JOIN (VALUES
+        ('Fruits', 'Fruits frais', 'Alimentaire'),
+        ('Légumes', 'Légumes frais', 'Alimentaire'),
+        ('Boissons', 'Boissons diverses', 'Alimentaire'),
+        ('Smartphones', 'Téléphones portables', 'Électronique'),
+        ('Ordinateurs', 'PC et accessoires', 'Électronique'),
+        ('Audio', 'Écouteurs, haut-parleurs', 'Électronique'),
+        ('Hommes', 'Vêtements pour hommes', 'Vêtements'),
+        ('Femmes', 'Vêtements pour femmes', 'Vêtements'),
+        ('Enfants', 'Vêtements pour enfants', 'Vêtements'),
+        ('Cuisine', 'Ustensiles et électroménager', 'Maison'),
+        ('Décoration', 'Objets décoratifs', 'Maison'),
+        ('Meubles', 'Mobilier de maison', 'Maison'),
+        ('Fitness', 'Équipement de fitness', 'Sport'),
+        ('Outdoor', 'Sports de plein air', 'Sport'),
+        ('Ballons', 'Ballons et équipements de sport', 'Sport'),
+        ('Papier', 'Papeterie et fournitures', 'Bureautique'),
+        ('Stylos', 'Stylos et crayons', 'Bureautique'),
+        ('Classement', 'Dossiers et classeurs', 'Bureautique')
+        ) AS v(nom, description, categorie) ON v.categorie = c.nom;
+    END IF;
+END
+$$;
@@ -0,0 +1,11 @@
+-- Full-text search over article titles and descriptions (French stemming).
+-- Title matches weigh more than description matches in ts_rank.
+
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('french', COALESCE(titre, '')), 'A') ||
+        setweight(to_tsvector('french', COALESCE(description, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_articles_search_vector
+    ON articles USING GIN (search_vector);
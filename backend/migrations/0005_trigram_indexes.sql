@@ -0,0 +1,11 @@
+-- Typo-tolerant autocomplete on article titles and category names.
+-- gin_trgm_ops indexes serve both word similarity (<%) and ILIKE prefixes.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_articles_titre_trgm
+    ON articles USING GIN (titre gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_categories_nom_trgm
+    ON categories USING GIN (nom gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_sous_categories_nom_trgm
+    ON sous_categories USING GIN (nom gin_trgm_ops);
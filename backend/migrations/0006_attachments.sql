@@ -0,0 +1,18 @@
+-- Content-addressed attachment store. Each distinct file is stored once,
+-- under its SHA-256, and counts the articles referencing it.
+
+CREATE TABLE IF NOT EXISTS attachments (
+    id SERIAL PRIMARY KEY,
+    sha256 TEXT UNIQUE NOT NULL,
+    size BIGINT NOT NULL,
+    content_type TEXT,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- piece_jointe keeps the client file name, used as the download name
+ALTER TABLE articles
+    ADD COLUMN IF NOT EXISTS attachment_id INTEGER REFERENCES attachments(id);
+
+CREATE INDEX IF NOT EXISTS idx_articles_attachment_id ON articles (attachment_id);
+CREATE INDEX IF NOT EXISTS idx_articles_piece_jointe ON articles (piece_jointe);
@@ -0,0 +1,10 @@
+-- Single-row counter bumped whenever users, roles or role permissions
+-- change. Stateless access tokens embed the value they were issued under;
+-- a token with an older value no longer has its claims trusted.
+
+CREATE TABLE IF NOT EXISTS auth_state (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    perm_version BIGINT NOT NULL DEFAULT 1
+);
+
+INSERT INTO auth_state (id) VALUES (TRUE) ON CONFLICT (id) DO NOTHING;
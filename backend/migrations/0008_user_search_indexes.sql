@@ -0,0 +1,9 @@
+-- Substring search on users (GET /api/auth/users?q=) and the role filter.
+
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm
+    ON users USING GIN (email gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_nom_trgm
+    ON users USING GIN (nom gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_prenom_trgm
+    ON users USING GIN (prenom gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_role_id ON users (role_id);
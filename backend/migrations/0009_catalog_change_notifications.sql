@@ -0,0 +1,25 @@
+-- Announce writes to the catalog tables on the catalog_changes channel, once
+-- per statement (a bulk COPY import sends one notification, not one per row).
+-- Workers use it to drop in-memory snapshots such as the category tree.
+
+CREATE OR REPLACE FUNCTION notify_catalog_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('catalog_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS articles_catalog_change ON articles;
+CREATE TRIGGER articles_catalog_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON articles
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+
+DROP TRIGGER IF EXISTS categories_catalog_change ON categories;
+CREATE TRIGGER categories_catalog_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
+
+DROP TRIGGER IF EXISTS sous_categories_catalog_change ON sous_categories;
+CREATE TRIGGER sous_categories_catalog_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON sous_categories
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_change();
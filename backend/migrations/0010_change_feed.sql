@@ -0,0 +1,100 @@
+-- Change feed for articles, categories and sous_categories.
+--
+-- Every insert and update stamps the row with a row_version taken from one
+-- shared sequence, so versions order all changes across the three tables.
+-- One notification per statement on data_changes lists the [id, version]
+-- pairs it touched; deletes get a fresh version. Statements touching more
+-- rows than fit in a notification send "rows": null, meaning "reload".
+-- This replaces the catalog_changes triggers from 0009.
+
+DROP TRIGGER IF EXISTS articles_catalog_change ON articles;
+DROP TRIGGER IF EXISTS categories_catalog_change ON categories;
+DROP TRIGGER IF EXISTS sous_categories_catalog_change ON sous_categories;
+DROP FUNCTION IF EXISTS notify_catalog_change();
+
+CREATE SEQUENCE IF NOT EXISTS row_version_seq;
+
+ALTER TABLE articles
+    ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+ALTER TABLE categories
+    ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+ALTER TABLE sous_categories
+    ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT nextval('row_version_seq');
+
+CREATE INDEX IF NOT EXISTS idx_articles_row_version ON articles (row_version);
+CREATE INDEX IF NOT EXISTS idx_categories_row_version ON categories (row_version);
+CREATE INDEX IF NOT EXISTS idx_sous_categories_row_version ON sous_categories (row_version);
+
+CREATE OR REPLACE FUNCTION stamp_row_version() RETURNS trigger AS $$
+BEGIN
+    NEW.row_version := nextval('row_version_seq');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_data_change() RETURNS trigger AS $$
+DECLARE
+    changed INTEGER;
+    changed_rows JSON;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        changed_rows := NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT COUNT(*), json_agg(json_build_array(id, nextval('row_version_seq')))
+        INTO changed, changed_rows
+        FROM old_rows;
+    ELSE
+        SELECT COUNT(*), json_agg(json_build_array(id, row_version))
+        INTO changed, changed_rows
+        FROM new_rows;
+    END IF;
+
+    IF changed = 0 THEN
+        RETURN NULL;
+    END IF;
+    -- Notification payloads are limited to 8000 bytes
+    IF changed > 300 THEN
+        changed_rows := NULL;
+    END IF;
+
+    PERFORM pg_notify('data_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', lower(TG_OP),
+        'rows', changed_rows
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t TEXT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['articles', 'categories', 'sous_categories'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_row_version ON %1$s', t);
+        EXECUTE format(
+            'CREATE TRIGGER %1$s_row_version BEFORE INSERT OR UPDATE ON %1$s '
+            'FOR EACH ROW EXECUTE FUNCTION stamp_row_version()', t);
+
+        -- Transition tables allow a single event per trigger
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_notify_insert ON %1$s', t);
+        EXECUTE format(
+            'CREATE TRIGGER %1$s_notify_insert AFTER INSERT ON %1$s '
+            'REFERENCING NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_data_change()', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_notify_update ON %1$s', t);
+        EXECUTE format(
+            'CREATE TRIGGER %1$s_notify_update AFTER UPDATE ON %1$s '
+            'REFERENCING NEW TABLE AS new_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_data_change()', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_notify_delete ON %1$s', t);
+        EXECUTE format(
+            'CREATE TRIGGER %1$s_notify_delete AFTER DELETE ON %1$s '
+            'REFERENCING OLD TABLE AS old_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_data_change()', t);
+        EXECUTE format('DROP TRIGGER IF EXISTS %1$s_notify_truncate ON %1$s', t);
+        EXECUTE format(
+            'CREATE TRIGGER %1$s_notify_truncate AFTER TRUNCATE ON %1$s '
+            'FOR EACH STATEMENT EXECUTE FUNCTION notify_data_change()', t);
+    END LOOP;
+END $$;
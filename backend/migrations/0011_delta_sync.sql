@@ -0,0 +1,90 @@
+-- Delta sync for articles, categories and sous_categories.
+--
+-- Every write also records the id of the transaction that made it (row_xid).
+-- Sequence values are taken when a row is written, not when its transaction
+-- commits, so a client that resumed from the highest row_version it saw could
+-- skip a slow transaction's rows. Sync watermarks are transaction snapshot
+-- horizons instead: everything below one has committed or rolled back.
+--
+-- Deletes leave a tombstone carrying the version announced on data_changes;
+-- truncating a table is recorded in sync_resets, since its rows can't be
+-- listed.
+
+ALTER TABLE articles ADD COLUMN IF NOT EXISTS row_xid xid8 NOT NULL DEFAULT '0';
+ALTER TABLE categories ADD COLUMN IF NOT EXISTS row_xid xid8 NOT NULL DEFAULT '0';
+ALTER TABLE sous_categories ADD COLUMN IF NOT EXISTS row_xid xid8 NOT NULL DEFAULT '0';
+
+CREATE INDEX IF NOT EXISTS idx_articles_row_xid ON articles (row_xid);
+CREATE INDEX IF NOT EXISTS idx_categories_row_xid ON categories (row_xid);
+CREATE INDEX IF NOT EXISTS idx_sous_categories_row_xid ON sous_categories (row_xid);
+
+CREATE TABLE IF NOT EXISTS tombstones (
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    row_version BIGINT NOT NULL,
+    row_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, row_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_tombstones_row_xid ON tombstones (row_xid);
+
+CREATE TABLE IF NOT EXISTS sync_resets (
+    table_name TEXT PRIMARY KEY,
+    row_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    reset_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION stamp_row_version() RETURNS trigger AS $$
+BEGIN
+    NEW.row_version := nextval('row_version_seq');
+    NEW.row_xid := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_data_change() RETURNS trigger AS $$
+DECLARE
+    changed INTEGER;
+    changed_rows JSON;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        INSERT INTO sync_resets (table_name) VALUES (TG_TABLE_NAME)
+        ON CONFLICT (table_name) DO UPDATE
+            SET row_xid = EXCLUDED.row_xid, reset_at = EXCLUDED.reset_at;
+        changed_rows := NULL;
+    ELSIF TG_OP = 'DELETE' THEN
+        WITH dead AS (
+            INSERT INTO tombstones (table_name, row_id, row_version)
+            SELECT TG_TABLE_NAME, id, nextval('row_version_seq') FROM old_rows
+            ON CONFLICT (table_name, row_id) DO UPDATE
+                SET row_version = EXCLUDED.row_version,
+                    row_xid = EXCLUDED.row_xid,
+                    deleted_at = EXCLUDED.deleted_at
+            RETURNING row_id, row_version
+        )
+        SELECT COUNT(*), json_agg(json_build_array(row_id, row_version))
+        INTO changed, changed_rows
+        FROM dead;
+    ELSE
+        SELECT COUNT(*), json_agg(json_build_array(id, row_version))
+        INTO changed, changed_rows
+        FROM new_rows;
+    END IF;
+
+    IF changed = 0 THEN
+        RETURN NULL;
+    END IF;
+    -- Notification payloads are limited to 8000 bytes
+    IF changed > 300 THEN
+        changed_rows := NULL;
+    END IF;
+
+    PERFORM pg_notify('data_changes', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', lower(TG_OP),
+        'rows', changed_rows
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
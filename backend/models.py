@@ -19,6 +19,30 @@ class ArticleCreate(ArticleBase):
 
 class Article(ArticleBase):
     id: int
+    categorie_id: Optional[int] = None
+    sous_categorie_id: Optional[int] = None
+
+
+class ArticleSearchResult(Article):
+    rank: float
+    snippet: str = ""
+
+
+class Suggestion(BaseModel):
+    type: str  # "article", "categorie" or "sous_categorie"
+    id: int
+    label: str
+    score: float
+
+
+class ImportRowError(BaseModel):
+    line: int
+    errors: List[str]
+
+
+class ImportReport(BaseModel):
+    imported: int
+    errors: List[ImportRowError] = []
 
 
 class Categorie(BaseModel):
@@ -27,11 +51,39 @@ class Categorie(BaseModel):
     description: Optional[str] = ""
 
 
+class SousCategorieNode(BaseModel):
+    id: int
+    nom: str
+    description: Optional[str] = ""
+    article_count: int
+
+
+class CategorieTree(Categorie):
+    article_count: int
+    sous_categories: List[SousCategorieNode]
+
+
 class SousCategorie(BaseModel):
     id: int
     nom: str
     description: Optional[str] = ""
     categorie: str
+    categorie_id: Optional[int] = None
+
+
+class SyncDeleted(BaseModel):
+    articles: List[int] = []
+    categories: List[int] = []
+    sous_categories: List[int] = []
+
+
+class SyncChanges(BaseModel):
+    version: int
+    reset: bool = False
+    articles: List[Article] = []
+    categories: List[Categorie] = []
+    sous_categories: List[SousCategorie] = []
+    deleted: SyncDeleted = SyncDeleted()
 
 
 # User Models for Authentication
@@ -121,6 +173,10 @@ class RoleUpdate(BaseModel):
     permission_ids: Optional[List[int]] = None
 
 
+class RolePermissionsUpdate(BaseModel):
+    permission_ids: List[int]
+
+
 class Role(RoleBase):
     id: int
     created_at: Optional[str] = None
@@ -0,0 +1,53 @@
+import base64
+import binascii
+import json
+from typing import List, Sequence
+from fastapi import HTTPException
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Range of the INTEGER columns (ids) cursors are compared against
+INT_MIN, INT_MAX = -(2**31), 2**31 - 1
+
+
+def valid_cursor_value(value, expected: type) -> bool:
+    # bool is an int subclass, but never a sort value
+    if isinstance(value, bool):
+        return False
+    if expected is int:
+        return isinstance(value, int) and INT_MIN <= value <= INT_MAX
+    if expected is float:
+        return isinstance(value, (int, float))
+    return isinstance(value, expected)
+
+
+def encode_cursor(sort: str, values: List) -> str:
+    """Encode the sort key values of the last row of a page as an opaque cursor."""
+    raw = json.dumps({"s": sort, "v": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, types: Sequence[type]) -> List:
+    """Decode a cursor produced by encode_cursor for the same sort order.
+
+    ``types`` gives the expected type of each value (int, float or str), so
+    a tampered cursor is refused here instead of failing in the query.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values = data["v"]
+        cursor_sort = data["s"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if cursor_sort != sort or not isinstance(values, list):
+        raise HTTPException(
+            status_code=400, detail="Cursor does not match the requested sort"
+        )
+    if len(values) != len(types) or not all(
+        valid_cursor_value(value, expected) for value, expected in zip(values, types)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+import asyncpg
+from database import connect
+
+logger = logging.getLogger(__name__)
+
+# Channel the change triggers (migration 0010) notify for every write to
+# articles, categories and sous_categories
+DATA_CHANGES_CHANNEL = "data_changes"
+
+# Seconds between attempts to re-open a lost listening connection
+RECONNECT_DELAY = 5
+
+# Channel -> callbacks, registered with subscribe() at import time
+listeners: Dict[str, List[Callable[[Optional[str]], None]]] = defaultdict(list)
+
+# One dedicated connection per worker LISTENs on every channel; it stays out
+# of the pool because it has to be held for the life of the process
+listen_conn: asyncpg.Connection = None
+reconnect_task: asyncio.Task = None
+
+
+def subscribe(channel: str, callback: Callable[[Optional[str]], None]):
+    """Call ``callback(payload)`` for every notification on ``channel``.
+
+    Subscribe before start_listener runs. Callbacks run on the event loop and
+    must not block. They get ``None`` when notifications may have been missed
+    (the connection was lost) and must then drop everything they cached.
+    """
+    listeners[channel].append(callback)
+
+
+def dispatch(channel: str, payload: Optional[str]):
+    for callback in listeners[channel]:
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Notification handler failed on %s", channel)
+
+
+def dispatch_all(payload: Optional[str]):
+    for channel in listeners:
+        dispatch(channel, payload)
+
+
+def on_notification(conn, pid, channel, payload):
+    dispatch(channel, payload)
+
+
+def on_terminated(conn):
+    global listen_conn, reconnect_task
+    if conn is not listen_conn:
+        return
+    listen_conn = None
+    logger.warning("Notification connection lost, reconnecting")
+    dispatch_all(None)
+    reconnect_task = asyncio.get_running_loop().create_task(reconnect())
+
+
+async def listen():
+    global listen_conn
+    conn = await connect()
+    for channel in listeners:
+        await conn.add_listener(channel, on_notification)
+    conn.add_termination_listener(on_terminated)
+    listen_conn = conn
+
+
+async def reconnect():
+    while True:
+        await asyncio.sleep(RECONNECT_DELAY)
+        try:
+            await listen()
+        except (OSError, asyncpg.PostgresError):
+            logger.warning("Could not reconnect the notification listener")
+            continue
+        # Writes made while disconnected were never announced
+        dispatch_all(None)
+        return
+
+
+async def start_listener():
+    """Open this worker's LISTEN connection."""
+    if listen_conn is None and listeners:
+        await listen()
+
+
+async def stop_listener():
+    """Close this worker's LISTEN connection."""
+    global listen_conn, reconnect_task
+    if reconnect_task is not None:
+        reconnect_task.cancel()
+        reconnect_task = None
+    if listen_conn is not None:
+        conn, listen_conn = listen_conn, None
+        await conn.close()
+
+
+async def notify(conn, channel: str, payload: str):
+    """Notify every worker; inside a transaction it is sent on commit."""
+    await conn.execute("SELECT pg_notify($1, $2)", channel, payload)
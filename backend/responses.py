@@ -0,0 +1,64 @@
+import os
+from typing import Any, Iterable, Optional, Sequence
+import asyncpg
+import orjson
+from fastapi import Response
+from pydantic import TypeAdapter
+
+# Opt-in fast path for the read endpoints: records are encoded straight to
+# JSON by orjson instead of being validated row by row against the response
+# model. The route's SQL is then responsible for the response's shape.
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() == "true"
+
+
+class RecordsResponse(Response):
+    """JSON array of asyncpg records, encoded by orjson.
+
+    Columns named in ``exclude`` (e.g. a keyset sort value) are left out.
+    """
+
+    media_type = "application/json"
+
+    def __init__(self, records: Sequence[asyncpg.Record], exclude: Iterable[str] = ()):
+        self.exclude = frozenset(exclude)
+        super().__init__(records)
+
+    def encode_record(self, record):
+        if not isinstance(record, asyncpg.Record):
+            raise TypeError(f"Cannot encode {type(record).__name__} as JSON")
+        row = dict(record)
+        for name in self.exclude:
+            del row[name]
+        return row
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=self.encode_record)
+
+
+def keep_headers(result: Response, response: Optional[Response]) -> Response:
+    """Copy headers already set on the route's ``response`` (cursors, ETags)
+    onto the response it returns instead."""
+    if response is not None:
+        result.raw_headers.extend(
+            header for header in response.raw_headers if header[0] != b"content-length"
+        )
+    return result
+
+
+def records_response(
+    records: Sequence[asyncpg.Record], response: Response, exclude: Iterable[str] = ()
+) -> RecordsResponse:
+    """Answer with ``records`` as JSON, keeping the route's headers."""
+    return keep_headers(RecordsResponse(records, exclude), response)
+
+
+def validated_response(
+    adapter: TypeAdapter, content: Any, response: Optional[Response] = None
+) -> Response:
+    """Answer with ``content`` checked and encoded by ``adapter``.
+
+    For routes whose payload has a different shape than their declared
+    response model, e.g. a trimmed set of fields.
+    """
+    body = adapter.dump_json(adapter.validate_python(content))
+    return keep_headers(Response(body, media_type="application/json"), response)
@@ -1,16 +1,164 @@
+import csv
+import io
+import json
 import os
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
-from typing import List
-from database import connect
-from models import Article, ArticleCreate
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    UploadFile,
+    File,
+    Form,
+    HTTPException,
+    Path as PathParam,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from functools import lru_cache
+from pydantic import BaseModel, TypeAdapter, ValidationError, create_model
+from typing import List, Optional, Tuple, Type
+from auth import require_permission
+from conditional import (
+    etag_matches,
+    not_modified_since,
+    note_local_change,
+    table_etag,
+)
+from database import get_db
+from models import (
+    Article,
+    ArticleBase,
+    ArticleCreate,
+    ArticleSearchResult,
+    ImportReport,
+    ImportRowError,
+    Suggestion,
+)
+from pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+from responses import FAST_JSON, records_response, validated_response
+from routes.categories import category_tree_cache
+from storage import (
+    add_attachment_reference,
+    attachment_path,
+    delete_unreferenced_file,
+    discard_upload,
+    legacy_upload_path,
+    release_attachment,
+    save_upload,
+)
+from thumbnails import THUMBNAIL_FORMAT, THUMBNAIL_MEDIA_TYPES, ensure_thumbnail
 
 router = APIRouter()
-UPLOAD_DIR = "uploads"
+# Rows fetched per server-side cursor round trip during exports
+EXPORT_BATCH_SIZE = 1000
+
+# Files addressed by hash never change; name and article URLs can point to a
+# new file, so clients revalidate them (a cheap 304 against the ETag)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+# Article fields and the SQL that reads each one; this is also the whitelist
+# for ?fields= on the read endpoints.
+ARTICLE_FIELDS = {
+    "id": "a.id",
+    "titre": "a.titre",
+    "prix": "a.prix",
+    "unite": "a.unite",
+    "description": "a.description",
+    "categorie_id": "a.categorie_id",
+    "categorie": "c.nom AS categorie",
+    "sous_categorie_id": "a.sous_categorie_id",
+    "sous_categorie": "sc.nom AS sous_categorie",
+    "date_rappel": "a.date_rappel",
+    "piece_jointe": "a.piece_jointe",
+}
+# Articles reference their category and sous-category by id; the API keeps
+# exposing the names, read through these joins.
+ARTICLE_JOINS = {
+    "categorie": "LEFT JOIN categories c ON c.id = a.categorie_id",
+    "sous_categorie": "LEFT JOIN sous_categories sc ON sc.id = a.sous_categorie_id",
+}
+ARTICLE_COLUMNS = ", ".join(ARTICLE_FIELDS.values())
+ARTICLE_FROM = f"FROM articles a {' '.join(ARTICLE_JOINS.values())}"
+ARTICLE_SELECT = f"SELECT {ARTICLE_COLUMNS} {ARTICLE_FROM}"
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Check a ?fields= list against the article fields.
+
+    Returns None when all fields are wanted. The id is always included, and
+    fields keep their usual order whatever order they were asked in.
+    """
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - ARTICLE_FIELDS.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return tuple(name for name in ARTICLE_FIELDS if name == "id" or name in names)
+
+
+def article_projection(fields: Optional[Tuple[str, ...]]) -> Tuple[str, str]:
+    """SELECT list and FROM clause reading only ``fields``.
+
+    The category joins are left out when their names are not wanted.
+    """
+    if fields is None:
+        return ARTICLE_COLUMNS, ARTICLE_FROM
+    columns = ", ".join(ARTICLE_FIELDS[name] for name in fields)
+    joins = " ".join(sql for name, sql in ARTICLE_JOINS.items() if name in fields)
+    return columns, f"FROM articles a {joins}"
+
+
+# One model per field combination; the whitelist bounds how many there are
+@lru_cache(maxsize=None)
+def article_model(fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """Article model trimmed to ``fields``."""
+    return create_model(
+        "ArticleFields",
+        **{
+            name: (Article.model_fields[name].annotation, Article.model_fields[name])
+            for name in fields
+        },
+    )
+
+
+@lru_cache(maxsize=None)
+def article_adapter(fields: Tuple[str, ...], many: bool = False) -> TypeAdapter:
+    """Validator/encoder for one trimmed article, or a list of them."""
+    model = article_model(fields)
+    return TypeAdapter(List[model] if many else model)
+
+
+async def resolve_category_ids(conn, categorie: str, sous_categorie: str):
+    """Resolve category and sous-category names to their ids."""
+    row = await conn.fetchrow(
+        """
+        SELECT c.id AS categorie_id, sc.id AS sous_categorie_id
+        FROM categories c
+        LEFT JOIN sous_categories sc ON sc.categorie_id = c.id AND sc.nom = $2
+        WHERE c.nom = $1
+        ORDER BY c.id, sc.id
+        LIMIT 1
+        """,
+        categorie,
+        sous_categorie,
+    )
+    if not row:
+        raise HTTPException(status_code=400, detail="Category does not exist")
+    if row["sous_categorie_id"] is None:
+        raise HTTPException(status_code=400, detail="Sous-category does not exist")
+    return row["categorie_id"], row["sous_categorie_id"]
 
 
 @router.post("/", response_model=Article)
 async def create_article(
+    background_tasks: BackgroundTasks,
     titre: str = Form(...),
     prix: float = Form(...),
     unite: str = Form(...),
@@ -19,88 +167,697 @@ async def create_article(
     sous_categorie: str = Form(...),
     date_rappel: str = Form(""),
     file: UploadFile = File(None),
+    conn=Depends(get_db),
 ):
-    filename = None
-    if file:
-        filename = file.filename
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-
-    conn = await connect()
-    row = await conn.fetchrow(
-        """
-        INSERT INTO articles (titre, prix, unite, description, categorie, sous_categorie, date_rappel, piece_jointe)
-        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-        RETURNING *;
-    """,
-        titre,
-        prix,
-        unite,
-        description,
-        categorie,
-        sous_categorie,
-        date_rappel,
-        filename,
+    categorie_id, sous_categorie_id = await resolve_category_ids(
+        conn, categorie, sous_categorie
     )
-    await conn.close()
-    return dict(row)
+
+    stored = await save_upload(file) if file else None
+
+    try:
+        async with conn.transaction():
+            attachment_id = None
+            if stored:
+                attachment_id = await add_attachment_reference(conn, stored)
+
+            row = await conn.fetchrow(
+                """
+                INSERT INTO articles (titre, prix, unite, description, categorie_id, sous_categorie_id, date_rappel, piece_jointe, attachment_id)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                RETURNING id, titre, prix, unite, description, categorie_id,
+                          sous_categorie_id, date_rappel, piece_jointe;
+            """,
+                titre,
+                prix,
+                unite,
+                description,
+                categorie_id,
+                sous_categorie_id,
+                date_rappel,
+                stored["filename"] if stored else None,
+                attachment_id,
+            )
+    except Exception:
+        # The file entered the store before the rollback; drop it unless
+        # another article references the same content
+        if stored:
+            await delete_unreferenced_file(conn, stored["sha256"])
+        raise
+    finally:
+        if stored:
+            await discard_upload(stored)
+
+    category_tree_cache.clear()
+    note_local_change("articles")
+
+    # Render the preview once the response is sent
+    if stored:
+        background_tasks.add_task(
+            ensure_thumbnail, stored["sha256"], stored["content_type"]
+        )
+    return {**dict(row), "categorie": categorie, "sous_categorie": sous_categorie}
+
+
+# Sort keys accepted by list_articles, paired with the id as a tie-breaker.
+# Nullable columns are coalesced to match the expression indexes created in
+# migrations/0002_category_foreign_keys.sql.
+ARTICLE_SORT_KEYS = {
+    "id": "a.id",
+    "titre": "COALESCE(a.titre, '')",
+    "prix": "COALESCE(a.prix, 0)",
+    "date_rappel": "COALESCE(a.date_rappel, '')",
+}
+# Type of each sort key's value, checked when a cursor is decoded
+ARTICLE_SORT_TYPES = {"id": int, "titre": str, "prix": float, "date_rappel": str}
 
 
 @router.get("/", response_model=List[Article])
-async def list_articles():
-    conn = await connect()
-    rows = await conn.fetch("SELECT * FROM articles;")
-    await conn.close()
+async def list_articles(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    categorie: Optional[str] = None,
+    sous_categorie: Optional[str] = None,
+    categorie_id: Optional[int] = None,
+    sous_categorie_id: Optional[int] = None,
+    prix_min: Optional[float] = None,
+    prix_max: Optional[float] = None,
+    date_rappel_from: Optional[str] = None,
+    date_rappel_to: Optional[str] = None,
+    sort: str = Query("id", pattern="^-?(id|titre|prix|date_rappel)$"),
+    fields: Optional[str] = None,
+    etag=Depends(table_etag("articles", "categories", "sous_categories")),
+    conn=Depends(get_db),
+):
+    """List articles one keyset page at a time.
+
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    Unchanged pages are answered with 304 against their weak ETag.
+    ``fields`` (comma-separated) limits the columns read and returned.
+    """
+    selected = parse_fields(fields)
+    columns, from_clause = article_projection(selected)
+    descending = sort.startswith("-")
+    sort_expr = ARTICLE_SORT_KEYS[sort.lstrip("-")]
+    direction = "DESC" if descending else "ASC"
+
+    # Build filters dynamically
+    conditions = []
+    values = []
+
+    def param(value):
+        values.append(value)
+        return f"${len(values)}"
+
+    if categorie is not None:
+        conditions.append(
+            f"a.categorie_id IN (SELECT id FROM categories WHERE nom = {param(categorie)})"
+        )
+    if sous_categorie is not None:
+        conditions.append(
+            "a.sous_categorie_id IN "
+            f"(SELECT id FROM sous_categories WHERE nom = {param(sous_categorie)})"
+        )
+    if categorie_id is not None:
+        conditions.append(f"a.categorie_id = {param(categorie_id)}")
+    if sous_categorie_id is not None:
+        conditions.append(f"a.sous_categorie_id = {param(sous_categorie_id)}")
+    if prix_min is not None:
+        conditions.append(f"a.prix >= {param(prix_min)}")
+    if prix_max is not None:
+        conditions.append(f"a.prix <= {param(prix_max)}")
+    if date_rappel_from is not None:
+        conditions.append(f"a.date_rappel >= {param(date_rappel_from)}")
+    if date_rappel_to is not None:
+        conditions.append(f"a.date_rappel <= {param(date_rappel_to)}")
+
+    if cursor is not None:
+        last_value, last_id = decode_cursor(
+            cursor, sort, (ARTICLE_SORT_TYPES[sort.lstrip("-")], int)
+        )
+        comparison = "<" if descending else ">"
+        conditions.append(
+            f"({sort_expr}, a.id) {comparison} ({param(last_value)}, {param(last_id)})"
+        )
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f"""
+        SELECT {columns}, {sort_expr} AS sort_value
+        {from_clause}
+        {where}
+        ORDER BY {sort_expr} {direction}, a.id {direction}
+        LIMIT {param(limit + 1)}
+    """
+    rows = await conn.fetch(query, *values)
+
+    # One extra row tells us whether another page follows
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            sort, [last["sort_value"], last["id"]]
+        )
+    if FAST_JSON:
+        return records_response(rows, response, exclude=("sort_value",))
+    if selected is not None:
+        return validated_response(
+            article_adapter(selected, many=True), [dict(r) for r in rows], response
+        )
     return [dict(r) for r in rows]
 
 
+@router.get("/search", response_model=List[ArticleSearchResult])
+async def search_articles(
+    response: Response,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    conn=Depends(get_db),
+):
+    """Full-text search over article titles and descriptions.
+
+    Results are ranked with ts_rank and paginated like list_articles, with
+    the next page's cursor in the X-Next-Cursor header.
+    """
+    values = [q]
+    keyset = ""
+    if cursor is not None:
+        last_rank, last_id = decode_cursor(cursor, "rank", (float, int))
+        values += [last_rank, last_id]
+        keyset = "AND (ts_rank(a.search_vector, query), a.id) < ($2::real, $3)"
+    values.append(limit + 1)
+
+    # Rank every match through the GIN index, then build the joined rows
+    # and highlighted snippets for the requested page only
+    rows = await conn.fetch(
+        f"""
+        WITH matches AS (
+            SELECT a.id, ts_rank(a.search_vector, query) AS rank
+            FROM articles a, websearch_to_tsquery('french', $1) query
+            WHERE a.search_vector @@ query {keyset}
+            ORDER BY rank DESC, a.id DESC
+            LIMIT ${len(values)}
+        )
+        SELECT {ARTICLE_COLUMNS}, m.rank,
+               ts_headline(
+                   'french',
+                   COALESCE(NULLIF(a.description, ''), a.titre, ''),
+                   websearch_to_tsquery('french', $1),
+                   'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5'
+               ) AS snippet
+        {ARTICLE_FROM}
+        JOIN matches m ON m.id = a.id
+        ORDER BY m.rank DESC, m.id DESC
+        """,
+        *values,
+    )
+
+    # One extra row tells us whether another page follows
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(
+            "rank", [last["rank"], last["id"]]
+        )
+    return [dict(r) for r in rows]
+
+
+@router.get("/suggest", response_model=List[Suggestion])
+async def suggest(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    conn=Depends(get_db),
+):
+    """Autocomplete article titles and category names from a partial input.
+
+    Prefix matches come first, then typo-tolerant trigram matches ranked by
+    word similarity, so "smartphon" still finds "Smartphones".
+    """
+    # Escape LIKE wildcards so the input is matched literally
+    like = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    rows = await conn.fetch(
+        """
+        SELECT type, id, label, score FROM (
+            (SELECT 'article' AS type, id, titre AS label,
+                    titre ILIKE $2 AS is_prefix, word_similarity($1, titre) AS score
+             FROM articles
+             WHERE titre ILIKE $2 OR $1 <% titre
+             ORDER BY is_prefix DESC, score DESC, id
+             LIMIT $3)
+            UNION ALL
+            (SELECT 'categorie', id, nom, nom ILIKE $2, word_similarity($1, nom)
+             FROM categories
+             WHERE nom ILIKE $2 OR $1 <% nom
+             ORDER BY 4 DESC, 5 DESC, id
+             LIMIT $3)
+            UNION ALL
+            (SELECT 'sous_categorie', id, nom, nom ILIKE $2, word_similarity($1, nom)
+             FROM sous_categories
+             WHERE nom ILIKE $2 OR $1 <% nom
+             ORDER BY 4 DESC, 5 DESC, id
+             LIMIT $3)
+        ) suggestions
+        ORDER BY is_prefix DESC, score DESC, label
+        LIMIT $3
+        """,
+        prefix,
+        like,
+        limit,
+    )
+    return [dict(r) for r in rows]
+
+
+EXPORT_COLUMNS = [
+    "id",
+    "titre",
+    "prix",
+    "unite",
+    "description",
+    "categorie",
+    "sous_categorie",
+    "date_rappel",
+    "piece_jointe",
+]
+
+
+@router.get("/export")
+async def export_articles(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    current_user=Depends(require_permission("articles.export")),
+    conn=Depends(get_db),
+):
+    """Stream every article as CSV or NDJSON (requires articles.export permission).
+
+    Rows are read through a server-side cursor and sent batch by batch, so
+    memory stays flat whatever the size of the table.
+    """
+
+    def encode_csv(rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([row[column] for column in EXPORT_COLUMNS] for row in rows)
+        return buffer.getvalue()
+
+    def encode_ndjson(rows):
+        return "".join(
+            json.dumps(
+                {column: row[column] for column in EXPORT_COLUMNS}, ensure_ascii=False
+            )
+            + "\n"
+            for row in rows
+        )
+
+    encode = encode_csv if format == "csv" else encode_ndjson
+
+    async def stream():
+        if format == "csv":
+            yield encode_csv([dict(zip(EXPORT_COLUMNS, EXPORT_COLUMNS))])
+
+        # Server-side cursors only live inside a transaction
+        async with conn.transaction():
+            batch = []
+            async for row in conn.cursor(
+                f"{ARTICLE_SELECT} ORDER BY a.id", prefetch=EXPORT_BATCH_SIZE
+            ):
+                batch.append(row)
+                if len(batch) == EXPORT_BATCH_SIZE:
+                    yield encode(batch)
+                    batch = []
+            if batch:
+                yield encode(batch)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="articles.{format}"'},
+    )
+
+
+def parse_import_file(fileobj, format: str):
+    """Parse and validate an uploaded CSV/NDJSON file against ArticleBase.
+
+    Returns the valid articles as (line, ArticleBase) pairs and the
+    per-line errors of the others.
+    """
+    articles = []
+    errors = []
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+
+    try:
+        if format == "csv":
+            reader = csv.DictReader(text)
+            records = ((reader.line_num, record) for record in reader)
+        else:
+            records = (
+                (number, line)
+                for number, line in enumerate(text, start=1)
+                if line.strip()
+            )
+
+        for line, record in records:
+            try:
+                if format == "ndjson":
+                    record = json.loads(record)
+                articles.append((line, ArticleBase.model_validate(record)))
+            except ValidationError as e:
+                errors.append(
+                    ImportRowError(
+                        line=line,
+                        errors=[
+                            ": ".join(
+                                filter(
+                                    None, [".".join(map(str, err["loc"])), err["msg"]]
+                                )
+                            )
+                            for err in e.errors()
+                        ],
+                    )
+                )
+            except ValueError as e:
+                errors.append(ImportRowError(line=line, errors=[f"Invalid JSON: {e}"]))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File is not valid UTF-8")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Malformed CSV: {e}")
+    finally:
+        # Leave the upload's file open for UploadFile to close
+        text.detach()
+    return articles, errors
+
+
+@router.post("/import", response_model=ImportReport)
+async def import_articles(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    current_user=Depends(require_permission("articles.create")),
+    conn=Depends(get_db),
+):
+    """Bulk-import articles from a CSV or NDJSON file (requires articles.create permission).
+
+    Valid rows are loaded with COPY in a single transaction; invalid rows
+    are skipped and reported by line number.
+    """
+    if format is None:
+        extension = os.path.splitext(file.filename or "")[1].lower()
+        format = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}.get(extension)
+        if format is None:
+            raise HTTPException(
+                status_code=400, detail="Unknown file format, expected csv or ndjson"
+            )
+
+    # Parsing and validation are CPU-bound: keep them off the event loop
+    articles, errors = await run_in_threadpool(parse_import_file, file.file, format)
+
+    # Resolve every category and sous-category name in one query
+    category_names = list({article.categorie for _, article in articles})
+    rows = await conn.fetch(
+        """
+        SELECT c.nom AS categorie, c.id AS categorie_id,
+               sc.nom AS sous_categorie, sc.id AS sous_categorie_id
+        FROM categories c
+        LEFT JOIN sous_categories sc ON sc.categorie_id = c.id
+        WHERE c.nom = ANY($1::text[])
+        ORDER BY c.id DESC, sc.id DESC
+        """,
+        category_names,
+    )
+    # Ordered so the lowest ids win, like resolve_category_ids
+    category_ids = {row["categorie"]: row["categorie_id"] for row in rows}
+    sous_category_ids = {
+        (row["categorie"], row["sous_categorie"]): row["sous_categorie_id"]
+        for row in rows
+        if row["sous_categorie_id"] is not None
+    }
+
+    records = []
+    for line, article in articles:
+        if article.categorie not in category_ids:
+            errors.append(
+                ImportRowError(line=line, errors=["categorie: Category does not exist"])
+            )
+            continue
+        sous_categorie_id = sous_category_ids.get(
+            (article.categorie, article.sous_categorie)
+        )
+        if sous_categorie_id is None:
+            errors.append(
+                ImportRowError(
+                    line=line, errors=["sous_categorie: Sous-category does not exist"]
+                )
+            )
+            continue
+        records.append(
+            (
+                article.titre,
+                article.prix,
+                article.unite,
+                article.description,
+                category_ids[article.categorie],
+                sous_categorie_id,
+                article.date_rappel,
+            )
+        )
+
+    if records:
+        async with conn.transaction():
+            await conn.copy_records_to_table(
+                "articles",
+                records=records,
+                columns=[
+                    "titre",
+                    "prix",
+                    "unite",
+                    "description",
+                    "categorie_id",
+                    "sous_categorie_id",
+                    "date_rappel",
+                ],
+            )
+        category_tree_cache.clear()
+        note_local_change("articles")
+
+    errors.sort(key=lambda error: error.line)
+    return ImportReport(imported=len(records), errors=errors)
+
+
 @router.get("/{article_id}", response_model=Article)
-async def get_article(article_id: int):
-    conn = await connect()
-    row = await conn.fetchrow("SELECT * FROM articles WHERE id=$1;", article_id)
-    await conn.close()
+async def get_article(
+    article_id: int, fields: Optional[str] = None, conn=Depends(get_db)
+):
+    selected = parse_fields(fields)
+    columns, from_clause = article_projection(selected)
+    row = await conn.fetchrow(
+        f"SELECT {columns} {from_clause} WHERE a.id=$1;", article_id
+    )
     if not row:
         raise HTTPException(status_code=404, detail="Article not found")
+    if selected is not None:
+        return validated_response(article_adapter(selected), dict(row))
     return dict(row)
 
 
 @router.put("/{article_id}", response_model=Article)
-async def update_article(article_id: int, data: ArticleCreate):
-    conn = await connect()
+async def update_article(article_id: int, data: ArticleCreate, conn=Depends(get_db)):
+    categorie_id, sous_categorie_id = await resolve_category_ids(
+        conn, data.categorie, data.sous_categorie
+    )
     row = await conn.fetchrow(
         """
         UPDATE articles SET
             titre=$1, prix=$2, unite=$3, description=$4,
-            categorie=$5, sous_categorie=$6, date_rappel=$7
-        WHERE id=$8 RETURNING *;
+            categorie_id=$5, sous_categorie_id=$6, date_rappel=$7
+        WHERE id=$8
+        RETURNING id, titre, prix, unite, description, categorie_id,
+                  sous_categorie_id, date_rappel, piece_jointe;
     """,
         data.titre,
         data.prix,
         data.unite,
         data.description,
-        data.categorie,
-        data.sous_categorie,
+        categorie_id,
+        sous_categorie_id,
         data.date_rappel,
         article_id,
     )
-    await conn.close()
     if not row:
         raise HTTPException(status_code=404, detail="Article not found")
-    return dict(row)
+    category_tree_cache.clear()
+    note_local_change("articles")
+    return {
+        **dict(row),
+        "categorie": data.categorie,
+        "sous_categorie": data.sous_categorie,
+    }
 
 
 @router.delete("/{article_id}")
-async def delete_article(article_id: int):
-    conn = await connect()
-    await conn.execute("DELETE FROM articles WHERE id=$1;", article_id)
-    await conn.close()
+async def delete_article(article_id: int, conn=Depends(get_db)):
+    unreferenced = None
+    async with conn.transaction():
+        attachment_id = await conn.fetchval(
+            "DELETE FROM articles WHERE id=$1 RETURNING attachment_id;", article_id
+        )
+        if attachment_id is not None:
+            unreferenced = await release_attachment(conn, attachment_id)
+    category_tree_cache.clear()
+    note_local_change("articles")
+
+    # Only remove the file once its row is gone for good
+    if unreferenced:
+        await delete_unreferenced_file(conn, unreferenced)
     return {"message": "Deleted"}
 
 
+async def conditional_file_response(
+    request: Request,
+    path: str,
+    filename: Optional[str],
+    media_type: Optional[str] = None,
+    etag: Optional[str] = None,
+    cache_control: str = REVALIDATE_CACHE_CONTROL,
+) -> Response:
+    """Serve a file, answering conditional requests with 304.
+
+    FileResponse takes care of Range / If-Range (single and multi-range 206)
+    and hands the path to the server through the ASGI pathsend extension
+    when it supports it, so the body never goes through Python.
+    """
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {"Cache-Control": cache_control}
+    if etag:
+        headers["ETag"] = etag
+    response = FileResponse(
+        path=path,
+        filename=filename,
+        media_type=media_type,
+        headers=headers,
+        stat_result=stat_result,
+    )
+
+    # If-Modified-Since is ignored when If-None-Match is present (RFC 9110)
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        fresh = etag_matches(if_none_match, response.headers["etag"])
+    elif if_modified_since is not None:
+        fresh = not_modified_since(if_modified_since, stat_result.st_mtime)
+    else:
+        fresh = False
+    if fresh:
+        return Response(
+            status_code=304,
+            headers={
+                name: response.headers[name]
+                for name in ("cache-control", "etag", "last-modified")
+            },
+        )
+    return response
+
+
+async def attachment_response(
+    request: Request, attachment, filename: str, cache_control: str
+) -> Response:
+    # The content hash is a strong validator for every URL serving the file
+    return await conditional_file_response(
+        request,
+        attachment_path(attachment["sha256"]),
+        filename,
+        media_type=attachment["content_type"],
+        etag=f'"{attachment["sha256"]}"',
+        cache_control=cache_control,
+    )
+
+
+@router.get("/attachments/{sha256}")
+async def download_attachment_by_hash(
+    request: Request,
+    sha256: str = PathParam(..., pattern="^[0-9a-f]{64}$"),
+    name: Optional[str] = None,
+    conn=Depends(get_db),
+):
+    """Download a stored file by content hash; the response never changes."""
+    row = await conn.fetchrow(
+        "SELECT sha256, content_type FROM attachments WHERE sha256 = $1", sha256
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+    filename = os.path.basename(name or "") or sha256
+    return await attachment_response(request, row, filename, IMMUTABLE_CACHE_CONTROL)
+
+
+@router.get("/{article_id}/attachment")
+async def download_article_attachment(
+    article_id: int, request: Request, conn=Depends(get_db)
+):
+    row = await conn.fetchrow(
+        """
+        SELECT a.piece_jointe, at.sha256, at.content_type
+        FROM articles a
+        JOIN attachments at ON at.id = a.attachment_id
+        WHERE a.id = $1
+        """,
+        article_id,
+    )
+    if not row:
+        raise HTTPException(status_code=404, detail="File not found")
+    return await attachment_response(
+        request, row, row["piece_jointe"], REVALIDATE_CACHE_CONTROL
+    )
+
+
+@router.get("/{article_id}/thumbnail")
+async def get_article_thumbnail(
+    article_id: int, request: Request, conn=Depends(get_db)
+):
+    """Small preview of an article's image or PDF attachment."""
+    row = await conn.fetchrow(
+        """
+        SELECT at.sha256, at.content_type
+        FROM articles a
+        JOIN attachments at ON at.id = a.attachment_id
+        WHERE a.id = $1
+        """,
+        article_id,
+    )
+    path = await ensure_thumbnail(row["sha256"], row["content_type"]) if row else None
+    if not path:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    return await conditional_file_response(
+        request,
+        path,
+        None,
+        media_type=THUMBNAIL_MEDIA_TYPES[THUMBNAIL_FORMAT],
+        etag=f'"{os.path.basename(path)}"',
+    )
+
+
 @router.get("/download/{filename}")
-async def download_file(filename: str):
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    if os.path.exists(file_path):
-        return FileResponse(path=file_path, filename=filename)
+async def download_file(filename: str, request: Request, conn=Depends(get_db)):
+    # Names are not unique: serve the most recent article's file
+    row = await conn.fetchrow(
+        """
+        SELECT at.sha256, at.content_type
+        FROM articles a
+        JOIN attachments at ON at.id = a.attachment_id
+        WHERE a.piece_jointe = $1
+        ORDER BY a.id DESC
+        LIMIT 1
+        """,
+        filename,
+    )
+    if row:
+        return await attachment_response(
+            request, row, filename, REVALIDATE_CACHE_CONTROL
+        )
+
+    # Files uploaded before the content-addressed store
+    file_path = await run_in_threadpool(legacy_upload_path, filename)
+    if file_path:
+        return await conditional_file_response(request, file_path, filename)
     raise HTTPException(status_code=404, detail="File not found")
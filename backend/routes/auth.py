@@ -1,6 +1,16 @@
+import hashlib
+import asyncpg
 from datetime import timedelta, datetime
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 from jose import JWTError, jwt
@@ -15,6 +25,7 @@ from models import (
     RoleCreate,
     RoleUpdate,
     RoleWithPermissions,
+    RolePermissionsUpdate,
     Permission,
     RolePermissionResponse,
     PermissionCheck,
@@ -23,7 +34,11 @@ from models import (
 from auth import (
     authenticate_user,
     create_access_token,
-    get_password_hash,
+    get_password_hash_async,
+    invalidate_role,
+    stateless_claims,
+    STATELESS_TOKENS,
+    invalidate_users,
     get_current_active_user,
     get_current_active_user_with_role,
     get_user_by_email,
@@ -31,55 +46,66 @@ from auth import (
     require_any_permission,
     check_user_permission,
     ACCESS_TOKEN_EXPIRE_MINUTES,
+    AUTH_CACHE_TTL,
+    AUTH_CHANNEL,
 )
-from database import connect
+from cache import TTLCache
+from conditional import etag_matches
+from database import acquire, get_db
+from pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor
+from pubsub import subscribe
 
 router = APIRouter()
 
 
+# Registration and login borrow a connection only around their queries, not
+# while bcrypt runs, so a burst of them can't hold the whole pool.
+
+
 @router.post("/register", response_model=User)
 async def register_user(user: UserCreate):
     """Register a new user."""
+    email_taken = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
+    )
     # Check if user already exists
-    existing_user = await get_user_by_email(user.email)
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered"
-        )
+    if await get_user_by_email(user.email):
+        raise email_taken
 
     # Hash password and create user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
 
     # Always set new users to viewer role (ID 5) for security
     viewer_role_id = 5
 
-    conn = await connect()
     try:
-        result = await conn.fetchrow(
-            """
-            INSERT INTO users (email, nom, prenom, hashed_password, role_id)
-            VALUES ($1, $2, $3, $4, $5)
-            RETURNING id, email, nom, prenom, role_id, is_active, created_at, updated_at
-            """,
-            user.email,
-            user.nom,
-            user.prenom,
-            hashed_password,
-            viewer_role_id,
-        )
-
-        return User(
-            id=result["id"],
-            email=result["email"],
-            nom=result["nom"],
-            prenom=result["prenom"],
-            role_id=result["role_id"],
-            is_active=result["is_active"],
-            created_at=str(result["created_at"]) if result["created_at"] else None,
-            updated_at=str(result["updated_at"]) if result["updated_at"] else None,
-        )
-    finally:
-        await conn.close()
+        async with acquire() as conn:
+            result = await conn.fetchrow(
+                """
+                INSERT INTO users (email, nom, prenom, hashed_password, role_id)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id, email, nom, prenom, role_id, is_active, created_at, updated_at
+                """,
+                user.email,
+                user.nom,
+                user.prenom,
+                hashed_password,
+                viewer_role_id,
+            )
+    except asyncpg.UniqueViolationError:
+        # Registered concurrently while the password was hashed
+        raise email_taken
+
+    return User(
+        id=result["id"],
+        email=result["email"],
+        nom=result["nom"],
+        prenom=result["prenom"],
+        role_id=result["role_id"],
+        is_active=result["is_active"],
+        created_at=str(result["created_at"]) if result["created_at"] else None,
+        updated_at=str(result["updated_at"]) if result["updated_at"] else None,
+    )
 
 
 @router.post("/login", response_model=Token)
@@ -93,10 +119,13 @@ async def login_user(user_credentials: UserLogin):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    claims = {"sub": user["email"]}
+    if STATELESS_TOKENS:
+        async with acquire() as conn:
+            claims.update(await stateless_claims(user["email"], conn))
+
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
-    )
+    access_token = create_access_token(data=claims, expires_delta=access_token_expires)
 
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -111,54 +140,87 @@ async def read_users_me(
 
 @router.get("/users", response_model=List[UserWithRole])
 async def get_all_users(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, min_length=1, max_length=100),
+    role_id: Optional[int] = None,
+    is_active: Optional[bool] = None,
     current_user: UserWithRole = Depends(require_permission("users.read")),
+    conn=Depends(get_db),
 ):
-    """Get all users with their roles (requires users.read permission)."""
-    conn = await connect()
-    try:
-        results = await conn.fetch(
-            """
-            SELECT u.id, u.email, u.nom, u.prenom, u.role_id, u.is_active, 
-                   u.created_at, u.updated_at, r.name as role_name, 
-                   r.display_name as role_display_name
-            FROM users u 
-            JOIN roles r ON u.role_id = r.id
-            ORDER BY u.id
-            """
+    """Get users with their roles, one keyset page at a time (requires users.read).
+
+    The cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    # Build filters dynamically
+    conditions = []
+    values = []
+
+    def param(value):
+        values.append(value)
+        return f"${len(values)}"
+
+    if q is not None:
+        # Escape LIKE wildcards so the input is matched literally
+        like = param(
+            "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
         )
+        conditions.append(
+            f"(u.email ILIKE {like} OR u.nom ILIKE {like} OR u.prenom ILIKE {like})"
+        )
+    if role_id is not None:
+        conditions.append(f"u.role_id = {param(role_id)}")
+    if is_active is not None:
+        conditions.append(f"u.is_active = {param(is_active)}")
+    if cursor is not None:
+        (last_id,) = decode_cursor(cursor, "id", (int,))
+        conditions.append(f"u.id > {param(last_id)}")
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Permissions are aggregated once per role, not queried per user
+    rows = await conn.fetch(
+        f"""
+        SELECT u.id, u.email, u.nom, u.prenom, u.role_id, u.is_active, 
+               u.created_at, u.updated_at, r.name as role_name, 
+               r.display_name as role_display_name,
+               COALESCE(rp.permissions, '{{}}') as permissions
+        FROM users u 
+        JOIN roles r ON u.role_id = r.id
+        LEFT JOIN (
+            SELECT rp.role_id, array_agg(p.name ORDER BY p.name) as permissions
+            FROM role_permissions rp
+            JOIN permissions p ON p.id = rp.permission_id
+            GROUP BY rp.role_id
+        ) rp ON rp.role_id = u.role_id
+        {where}
+        ORDER BY u.id
+        LIMIT {param(limit + 1)}
+        """,
+        *values,
+    )
 
-        users = []
-        for row in results:
-            # Get user permissions
-            permissions = await conn.fetch(
-                """
-                SELECT p.name 
-                FROM permissions p
-                JOIN role_permissions rp ON p.id = rp.permission_id
-                WHERE rp.role_id = $1
-                """,
-                row["role_id"],
-            )
-
-            users.append(
-                UserWithRole(
-                    id=row["id"],
-                    email=row["email"],
-                    nom=row["nom"],
-                    prenom=row["prenom"],
-                    role_id=row["role_id"],
-                    is_active=row["is_active"],
-                    role_name=row["role_name"],
-                    role_display_name=row["role_display_name"],
-                    permissions=[perm["name"] for perm in permissions],
-                    created_at=str(row["created_at"]) if row["created_at"] else None,
-                    updated_at=str(row["updated_at"]) if row["updated_at"] else None,
-                )
-            )
-
-        return users
-    finally:
-        await conn.close()
+    # One extra row tells us whether another page follows
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor("id", [rows[-1]["id"]])
+
+    return [
+        UserWithRole(
+            id=row["id"],
+            email=row["email"],
+            nom=row["nom"],
+            prenom=row["prenom"],
+            role_id=row["role_id"],
+            is_active=row["is_active"],
+            role_name=row["role_name"],
+            role_display_name=row["role_display_name"],
+            permissions=list(row["permissions"]),
+            created_at=str(row["created_at"]) if row["created_at"] else None,
+            updated_at=str(row["updated_at"]) if row["updated_at"] else None,
+        )
+        for row in rows
+    ]
 
 
 @router.put("/users/{user_id}", response_model=UserWithRole)
@@ -166,121 +228,125 @@ async def update_user(
     user_id: int,
     user_update: UserUpdate,
     current_user: UserWithRole = Depends(require_permission("users.update")),
+    conn=Depends(get_db),
 ):
     """Update a user (requires users.update permission)."""
     # Prevent non-super-admins from modifying super-admin users
     if current_user.role_name != "super_admin":
-        conn = await connect()
-        try:
-            target_user = await conn.fetchrow(
-                "SELECT role_id FROM users WHERE id = $1", user_id
+        target_user = await conn.fetchrow(
+            "SELECT role_id FROM users WHERE id = $1", user_id
+        )
+        if target_user:
+            target_role = await conn.fetchrow(
+                "SELECT name FROM roles WHERE id = $1", target_user["role_id"]
             )
-            if target_user:
-                target_role = await conn.fetchrow(
-                    "SELECT name FROM roles WHERE id = $1", target_user["role_id"]
+            if target_role and target_role["name"] == "super_admin":
+                raise HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN,
+                    detail="Cannot modify super admin users",
                 )
-                if target_role and target_role["name"] == "super_admin":
-                    raise HTTPException(
-                        status_code=status.HTTP_403_FORBIDDEN,
-                        detail="Cannot modify super admin users",
-                    )
-        finally:
-            await conn.close()
-
-    conn = await connect()
-    try:
-        # Build dynamic update query
-        update_fields = []
-        values = []
-        param_count = 1
-
-        if user_update.email is not None:
-            update_fields.append(f"email = ${param_count}")
-            values.append(user_update.email)
-            param_count += 1
-
-        if user_update.nom is not None:
-            update_fields.append(f"nom = ${param_count}")
-            values.append(user_update.nom)
-            param_count += 1
-
-        if user_update.prenom is not None:
-            update_fields.append(f"prenom = ${param_count}")
-            values.append(user_update.prenom)
-            param_count += 1
-
-        if user_update.role_id is not None:
-            update_fields.append(f"role_id = ${param_count}")
-            values.append(user_update.role_id)
-            param_count += 1
-
-        if user_update.is_active is not None:
-            update_fields.append(f"is_active = ${param_count}")
-            values.append(user_update.is_active)
-            param_count += 1
-
-        if not update_fields:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="No fields to update"
-            )
 
-        update_fields.append(f"updated_at = ${param_count}")
-        values.append(datetime.utcnow())
+    # Build dynamic update query
+    update_fields = []
+    values = []
+    param_count = 1
+
+    if user_update.email is not None:
+        update_fields.append(f"email = ${param_count}")
+        values.append(user_update.email)
         param_count += 1
 
-        values.append(user_id)
+    if user_update.nom is not None:
+        update_fields.append(f"nom = ${param_count}")
+        values.append(user_update.nom)
+        param_count += 1
 
-        query = f"""
-            UPDATE users 
-            SET {', '.join(update_fields)}
-            WHERE id = ${param_count}
-            RETURNING id, email, nom, prenom, role_id, is_active, created_at, updated_at
-        """
+    if user_update.prenom is not None:
+        update_fields.append(f"prenom = ${param_count}")
+        values.append(user_update.prenom)
+        param_count += 1
 
-        result = await conn.fetchrow(query, *values[:-1], user_id)
+    if user_update.role_id is not None:
+        update_fields.append(f"role_id = ${param_count}")
+        values.append(user_update.role_id)
+        param_count += 1
 
-        if not result:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-            )
+    if user_update.is_active is not None:
+        update_fields.append(f"is_active = ${param_count}")
+        values.append(user_update.is_active)
+        param_count += 1
 
-        # Get role information
-        role_info = await conn.fetchrow(
-            "SELECT name, display_name FROM roles WHERE id = $1", result["role_id"]
+    if not update_fields:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="No fields to update"
         )
 
-        # Get permissions
-        permissions = await conn.fetch(
-            """
-            SELECT p.name 
-            FROM permissions p
-            JOIN role_permissions rp ON p.id = rp.permission_id
-            WHERE rp.role_id = $1
-            """,
-            result["role_id"],
+    update_fields.append(f"updated_at = ${param_count}")
+    values.append(datetime.utcnow())
+    param_count += 1
+
+    values.append(user_id)
+
+    # A changed email leaves a cache entry under the old one
+    emails_to_forget = []
+    if user_update.email is not None:
+        old_email = await conn.fetchval(
+            "SELECT email FROM users WHERE id = $1", user_id
         )
+        if old_email:
+            emails_to_forget.append(old_email)
+
+    query = f"""
+        UPDATE users 
+        SET {', '.join(update_fields)}
+        WHERE id = ${param_count}
+        RETURNING id, email, nom, prenom, role_id, is_active, created_at, updated_at
+    """
 
-        return UserWithRole(
-            id=result["id"],
-            email=result["email"],
-            nom=result["nom"],
-            prenom=result["prenom"],
-            role_id=result["role_id"],
-            is_active=result["is_active"],
-            role_name=role_info["name"] if role_info else "",
-            role_display_name=role_info["display_name"] if role_info else "",
-            permissions=[perm["name"] for perm in permissions],
-            created_at=str(result["created_at"]) if result["created_at"] else None,
-            updated_at=str(result["updated_at"]) if result["updated_at"] else None,
+    result = await conn.fetchrow(query, *values[:-1], user_id)
+
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
-    finally:
-        await conn.close()
+    await invalidate_users(conn, result["email"], *emails_to_forget)
+
+    # Get role information
+    role_info = await conn.fetchrow(
+        "SELECT name, display_name FROM roles WHERE id = $1", result["role_id"]
+    )
+
+    # Get permissions
+    permissions = await conn.fetch(
+        """
+        SELECT p.name 
+        FROM permissions p
+        JOIN role_permissions rp ON p.id = rp.permission_id
+        WHERE rp.role_id = $1
+        """,
+        result["role_id"],
+    )
+
+    return UserWithRole(
+        id=result["id"],
+        email=result["email"],
+        nom=result["nom"],
+        prenom=result["prenom"],
+        role_id=result["role_id"],
+        is_active=result["is_active"],
+        role_name=role_info["name"] if role_info else "",
+        role_display_name=role_info["display_name"] if role_info else "",
+        permissions=[perm["name"] for perm in permissions],
+        created_at=str(result["created_at"]) if result["created_at"] else None,
+        updated_at=str(result["updated_at"]) if result["updated_at"] else None,
+    )
 
 
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: int,
     current_user: UserWithRole = Depends(require_permission("users.delete")),
+    conn=Depends(get_db),
 ):
     """Delete a user (requires users.delete permission)."""
     # Prevent deletion of super admin users and self-deletion
@@ -290,101 +356,160 @@ async def delete_user(
             detail="Cannot delete your own account",
         )
 
-    conn = await connect()
-    try:
-        # Check if target user is super admin
-        target_user = await conn.fetchrow(
-            """
-            SELECT u.id, r.name as role_name 
-            FROM users u 
-            JOIN roles r ON u.role_id = r.id 
-            WHERE u.id = $1
-            """,
-            user_id,
-        )
+    # Check if target user is super admin
+    target_user = await conn.fetchrow(
+        """
+        SELECT u.id, u.email, r.name as role_name 
+        FROM users u 
+        JOIN roles r ON u.role_id = r.id 
+        WHERE u.id = $1
+        """,
+        user_id,
+    )
 
-        if not target_user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-            )
+    if not target_user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
 
-        if (
-            target_user["role_name"] == "super_admin"
-            and current_user.role_name != "super_admin"
-        ):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Cannot delete super admin users",
-            )
+    if (
+        target_user["role_name"] == "super_admin"
+        and current_user.role_name != "super_admin"
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cannot delete super admin users",
+        )
 
-        await conn.execute("DELETE FROM users WHERE id = $1", user_id)
-        return {"message": "User deleted successfully"}
-    finally:
-        await conn.close()
+    await conn.execute("DELETE FROM users WHERE id = $1", user_id)
+    await invalidate_users(conn, target_user["email"])
+    return {"message": "User deleted successfully"}
 
 
 # Role Management Endpoints
 
 
+# The whole GET /roles payload, built by Postgres in one query
+ROLES_MATRIX_QUERY = """
+    WITH perms AS (
+        SELECT id, resource, action, json_build_object(
+            'id', id,
+            'name', name,
+            'display_name', display_name,
+            'description', COALESCE(description, ''),
+            'resource', resource,
+            'action', action,
+            'created_at', created_at::text
+        ) AS obj
+        FROM permissions
+    )
+    SELECT json_build_object(
+        'roles', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', r.id,
+                'name', r.name,
+                'display_name', r.display_name,
+                'description', COALESCE(r.description, ''),
+                'is_active', r.is_active,
+                'created_at', r.created_at::text,
+                'permissions', COALESCE((
+                    SELECT json_agg(perms.obj ORDER BY perms.resource, perms.action)
+                    FROM role_permissions rp
+                    JOIN perms ON perms.id = rp.permission_id
+                    WHERE rp.role_id = r.id
+                ), '[]'::json)
+            ) ORDER BY r.id)
+            FROM roles r
+        ), '[]'::json),
+        'permissions', COALESCE((
+            SELECT json_agg(obj ORDER BY resource, action) FROM perms
+        ), '[]'::json)
+    )::text
+"""
+
+# Serialized matrix and its ETag; dropped on any role or user change
+roles_matrix_cache = TTLCache(AUTH_CACHE_TTL)
+
+
+def forget_roles_matrix(payload: Optional[str]):
+    roles_matrix_cache.clear()
+
+
+subscribe(AUTH_CHANNEL, forget_roles_matrix)
+
+
 @router.get("/roles", response_model=RolePermissionResponse)
 async def get_roles_and_permissions(
+    request: Request,
     current_user: UserWithRole = Depends(require_permission("roles.read")),
+    conn=Depends(get_db),
 ):
     """Get all roles with their permissions and all available permissions."""
-    conn = await connect()
+    cached = roles_matrix_cache.get("matrix")
+    if cached is None:
+        generation = roles_matrix_cache.generation
+        body = (await conn.fetchval(ROLES_MATRIX_QUERY)).encode()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        cached = (body, etag)
+        roles_matrix_cache.set("matrix", cached, generation)
+    body, etag = cached
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def set_role_permissions(conn, role_id: int, permission_ids: List[int]):
+    """Make a role's permissions exactly ``permission_ids``.
+
+    Only the difference is applied, one statement each way, so readers never
+    see the role without its permissions. Call inside a transaction.
+    """
+    await conn.execute(
+        """
+        DELETE FROM role_permissions
+        WHERE role_id = $1 AND NOT (permission_id = ANY($2::int[]))
+        """,
+        role_id,
+        permission_ids,
+    )
     try:
-        # Get all roles
-        roles_data = await conn.fetch(
-            "SELECT id, name, display_name, description, is_active, created_at FROM roles ORDER BY id"
+        await conn.execute(
+            """
+            INSERT INTO role_permissions (role_id, permission_id)
+            SELECT $1, unnest($2::int[])
+            ON CONFLICT (role_id, permission_id) DO NOTHING
+            """,
+            role_id,
+            permission_ids,
         )
-
-        # Get all permissions
-        permissions_data = await conn.fetch(
-            "SELECT id, name, display_name, description, resource, action, created_at FROM permissions ORDER BY resource, action"
+    except asyncpg.ForeignKeyViolationError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Unknown permission id"
         )
 
-        roles = []
-        for role_row in roles_data:
-            # Get permissions for this role
-            role_permissions = await conn.fetch(
-                """
-                SELECT p.id, p.name, p.display_name, p.description, p.resource, p.action, p.created_at
-                FROM permissions p
-                JOIN role_permissions rp ON p.id = rp.permission_id
-                WHERE rp.role_id = $1
-                ORDER BY p.resource, p.action
-                """,
-                role_row["id"],
-            )
 
-            roles.append(
-                RoleWithPermissions(
-                    id=role_row["id"],
-                    name=role_row["name"],
-                    display_name=role_row["display_name"],
-                    description=role_row["description"] or "",
-                    is_active=role_row["is_active"],
-                    created_at=(
-                        str(role_row["created_at"]) if role_row["created_at"] else None
-                    ),
-                    permissions=[
-                        Permission(
-                            id=perm["id"],
-                            name=perm["name"],
-                            display_name=perm["display_name"],
-                            description=perm["description"] or "",
-                            resource=perm["resource"],
-                            action=perm["action"],
-                            created_at=(
-                                str(perm["created_at"]) if perm["created_at"] else None
-                            ),
-                        )
-                        for perm in role_permissions
-                    ],
-                )
-            )
+async def role_with_permissions(conn, role_row) -> RoleWithPermissions:
+    permissions = await conn.fetch(
+        """
+        SELECT p.id, p.name, p.display_name, p.description, p.resource, p.action, p.created_at
+        FROM permissions p
+        JOIN role_permissions rp ON p.id = rp.permission_id
+        WHERE rp.role_id = $1
+        """,
+        role_row["id"],
+    )
 
-        permissions = [
+    return RoleWithPermissions(
+        id=role_row["id"],
+        name=role_row["name"],
+        display_name=role_row["display_name"],
+        description=role_row["description"] or "",
+        is_active=role_row["is_active"],
+        created_at=str(role_row["created_at"]) if role_row["created_at"] else None,
+        permissions=[
             Permission(
                 id=perm["id"],
                 name=perm["name"],
@@ -394,77 +519,40 @@ async def get_roles_and_permissions(
                 action=perm["action"],
                 created_at=str(perm["created_at"]) if perm["created_at"] else None,
             )
-            for perm in permissions_data
-        ]
-
-        return RolePermissionResponse(roles=roles, permissions=permissions)
-    finally:
-        await conn.close()
+            for perm in permissions
+        ],
+    )
 
 
 @router.post("/roles", response_model=RoleWithPermissions)
 async def create_role(
     role: RoleCreate,
     current_user: UserWithRole = Depends(require_permission("roles.create")),
+    conn=Depends(get_db),
 ):
     """Create a new role with permissions."""
-    conn = await connect()
     try:
-        # Create role
-        role_result = await conn.fetchrow(
-            """
-            INSERT INTO roles (name, display_name, description, is_active)
-            VALUES ($1, $2, $3, $4)
-            RETURNING id, name, display_name, description, is_active, created_at
-            """,
-            role.name,
-            role.display_name,
-            role.description,
-            role.is_active,
-        )
-
-        # Assign permissions to role
-        if role.permission_ids:
-            for perm_id in role.permission_ids:
-                await conn.execute(
-                    "INSERT INTO role_permissions (role_id, permission_id) VALUES ($1, $2)",
-                    role_result["id"],
-                    perm_id,
-                )
+        async with conn.transaction():
+            # Create role
+            role_result = await conn.fetchrow(
+                """
+                INSERT INTO roles (name, display_name, description, is_active)
+                VALUES ($1, $2, $3, $4)
+                RETURNING id, name, display_name, description, is_active, created_at
+                """,
+                role.name,
+                role.display_name,
+                role.description,
+                role.is_active,
+            )
 
-        # Get assigned permissions
-        permissions = await conn.fetch(
-            """
-            SELECT p.id, p.name, p.display_name, p.description, p.resource, p.action, p.created_at
-            FROM permissions p
-            JOIN role_permissions rp ON p.id = rp.permission_id
-            WHERE rp.role_id = $1
-            """,
-            role_result["id"],
-        )
+            # Assign permissions to role
+            await set_role_permissions(conn, role_result["id"], role.permission_ids)
+        await invalidate_role(conn, role_result["id"])
 
-        return RoleWithPermissions(
-            id=role_result["id"],
-            name=role_result["name"],
-            display_name=role_result["display_name"],
-            description=role_result["description"] or "",
-            is_active=role_result["is_active"],
-            created_at=(
-                str(role_result["created_at"]) if role_result["created_at"] else None
-            ),
-            permissions=[
-                Permission(
-                    id=perm["id"],
-                    name=perm["name"],
-                    display_name=perm["display_name"],
-                    description=perm["description"] or "",
-                    resource=perm["resource"],
-                    action=perm["action"],
-                    created_at=str(perm["created_at"]) if perm["created_at"] else None,
-                )
-                for perm in permissions
-            ],
-        )
+        return await role_with_permissions(conn, role_result)
+    except HTTPException:
+        raise
     except Exception as e:
         if "unique constraint" in str(e).lower():
             raise HTTPException(
@@ -475,8 +563,6 @@ async def create_role(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create role",
         )
-    finally:
-        await conn.close()
 
 
 @router.put("/roles/{role_id}", response_model=RoleWithPermissions)
@@ -484,43 +570,47 @@ async def update_role(
     role_id: int,
     role_update: RoleUpdate,
     current_user: UserWithRole = Depends(require_permission("roles.update")),
+    conn=Depends(get_db),
 ):
     """Update a role and its permissions."""
-    conn = await connect()
-    try:
-        # Check if role exists
-        existing_role = await conn.fetchrow(
-            "SELECT * FROM roles WHERE id = $1", role_id
-        )
-        if not existing_role:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Role not found"
-            )
-
-        # Build update query
-        update_fields = []
-        values = []
-        param_count = 1
+    # Build update query
+    update_fields = []
+    values = []
+    param_count = 1
+
+    if role_update.name is not None:
+        update_fields.append(f"name = ${param_count}")
+        values.append(role_update.name)
+        param_count += 1
 
-        if role_update.name is not None:
-            update_fields.append(f"name = ${param_count}")
-            values.append(role_update.name)
-            param_count += 1
+    if role_update.display_name is not None:
+        update_fields.append(f"display_name = ${param_count}")
+        values.append(role_update.display_name)
+        param_count += 1
 
-        if role_update.display_name is not None:
-            update_fields.append(f"display_name = ${param_count}")
-            values.append(role_update.display_name)
-            param_count += 1
+    if role_update.description is not None:
+        update_fields.append(f"description = ${param_count}")
+        values.append(role_update.description)
+        param_count += 1
 
-        if role_update.description is not None:
-            update_fields.append(f"description = ${param_count}")
-            values.append(role_update.description)
-            param_count += 1
+    if role_update.is_active is not None:
+        update_fields.append(f"is_active = ${param_count}")
+        values.append(role_update.is_active)
+        param_count += 1
 
-        if role_update.is_active is not None:
-            update_fields.append(f"is_active = ${param_count}")
-            values.append(role_update.is_active)
-            param_count += 1
+    async with conn.transaction():
+        # Check if role exists, locking it against concurrent updates
+        role_result = await conn.fetchrow(
+            """
+            SELECT id, name, display_name, description, is_active, created_at
+            FROM roles WHERE id = $1 FOR UPDATE
+            """,
+            role_id,
+        )
+        if not role_result:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Role not found"
+            )
 
         if update_fields:
             values.append(role_id)
@@ -531,98 +621,76 @@ async def update_role(
                 RETURNING id, name, display_name, description, is_active, created_at
             """
             role_result = await conn.fetchrow(query, *values)
-        else:
-            role_result = existing_role
 
         # Update permissions if provided
         if role_update.permission_ids is not None:
-            # Remove existing permissions
-            await conn.execute(
-                "DELETE FROM role_permissions WHERE role_id = $1", role_id
-            )
+            await set_role_permissions(conn, role_id, role_update.permission_ids)
+    await invalidate_role(conn, role_id)
 
-            # Add new permissions
-            for perm_id in role_update.permission_ids:
-                await conn.execute(
-                    "INSERT INTO role_permissions (role_id, permission_id) VALUES ($1, $2)",
-                    role_id,
-                    perm_id,
-                )
+    return await role_with_permissions(conn, role_result)
 
-        # Get current permissions
-        permissions = await conn.fetch(
+
+@router.put("/roles/{role_id}/permissions", response_model=RoleWithPermissions)
+async def replace_role_permissions(
+    role_id: int,
+    update: RolePermissionsUpdate,
+    current_user: UserWithRole = Depends(require_permission("roles.update")),
+    conn=Depends(get_db),
+):
+    """Replace a role's permissions with the given set."""
+    async with conn.transaction():
+        role = await conn.fetchrow(
             """
-            SELECT p.id, p.name, p.display_name, p.description, p.resource, p.action, p.created_at
-            FROM permissions p
-            JOIN role_permissions rp ON p.id = rp.permission_id
-            WHERE rp.role_id = $1
+            SELECT id, name, display_name, description, is_active, created_at
+            FROM roles WHERE id = $1 FOR UPDATE
             """,
             role_id,
         )
+        if not role:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Role not found"
+            )
+        await set_role_permissions(conn, role_id, update.permission_ids)
+    await invalidate_role(conn, role_id)
 
-        return RoleWithPermissions(
-            id=role_result["id"],
-            name=role_result["name"],
-            display_name=role_result["display_name"],
-            description=role_result["description"] or "",
-            is_active=role_result["is_active"],
-            created_at=(
-                str(role_result["created_at"]) if role_result["created_at"] else None
-            ),
-            permissions=[
-                Permission(
-                    id=perm["id"],
-                    name=perm["name"],
-                    display_name=perm["display_name"],
-                    description=perm["description"] or "",
-                    resource=perm["resource"],
-                    action=perm["action"],
-                    created_at=str(perm["created_at"]) if perm["created_at"] else None,
-                )
-                for perm in permissions
-            ],
-        )
-    finally:
-        await conn.close()
+    return await role_with_permissions(conn, role)
 
 
 @router.delete("/roles/{role_id}")
 async def delete_role(
     role_id: int,
     current_user: UserWithRole = Depends(require_permission("roles.delete")),
+    conn=Depends(get_db),
 ):
     """Delete a role (prevents deletion of system roles)."""
-    conn = await connect()
-    try:
-        # Check if role exists and is deletable
-        role = await conn.fetchrow("SELECT name FROM roles WHERE id = $1", role_id)
-        if not role:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="Role not found"
-            )
+    # Check if role exists and is deletable
+    role = await conn.fetchrow("SELECT name FROM roles WHERE id = $1", role_id)
+    if not role:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Role not found"
+        )
 
-        # Prevent deletion of system roles
-        system_roles = ["super_admin", "admin"]
-        if role["name"] in system_roles:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Cannot delete system roles",
-            )
+    # Prevent deletion of system roles
+    system_roles = ["super_admin", "admin"]
+    if role["name"] in system_roles:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot delete system roles",
+        )
 
-        # Check if role is assigned to users
-        user_count = await conn.fetchrow(
-            "SELECT COUNT(*) as count FROM users WHERE role_id = $1", role_id
+    # Check if role is assigned to users
+    user_count = await conn.fetchrow(
+        "SELECT COUNT(*) as count FROM users WHERE role_id = $1", role_id
+    )
+    if user_count["count"] > 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot delete role assigned to users",
         )
-        if user_count["count"] > 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Cannot delete role assigned to users",
-            )
 
-        await conn.execute("DELETE FROM roles WHERE id = $1", role_id)
-        return {"message": "Role deleted successfully"}
-    finally:
-        await conn.close()
+    await conn.execute("DELETE FROM roles WHERE id = $1", role_id)
+    await invalidate_role(conn, role_id)
+    return {"message": "Role deleted successfully"}
 
 
 @router.post("/check-permission", response_model=PermissionCheckResponse)
@@ -1,12 +1,61 @@
-from fastapi import APIRouter, HTTPException, Depends
+import os
+from fastapi import APIRouter, HTTPException, Depends, Response
 from typing import List, Optional
-from database import connect
-from models import Categorie
+import pubsub
+from cache import TTLCache
+from database import get_db
+from models import Categorie, CategorieTree
+from pubsub import DATA_CHANGES_CHANNEL, subscribe
+from responses import FAST_JSON, records_response
 from auth import get_current_active_user_with_role, require_permission
+from conditional import note_local_change, table_etag
 from pydantic import BaseModel
 
 router = APIRouter()
 
+# Categories with their sous-categories and article counts, as JSON
+CATEGORY_TREE_QUERY = """
+    WITH categorie_counts AS (
+        SELECT categorie_id, COUNT(*) AS n FROM articles GROUP BY categorie_id
+    ), sous_categorie_counts AS (
+        SELECT sous_categorie_id, COUNT(*) AS n FROM articles GROUP BY sous_categorie_id
+    ), children AS (
+        SELECT sc.categorie_id, json_agg(json_build_object(
+            'id', sc.id,
+            'nom', sc.nom,
+            'description', COALESCE(sc.description, ''),
+            'article_count', COALESCE(scc.n, 0)
+        ) ORDER BY sc.nom) AS items
+        FROM sous_categories sc
+        LEFT JOIN sous_categorie_counts scc ON scc.sous_categorie_id = sc.id
+        GROUP BY sc.categorie_id
+    )
+    SELECT COALESCE(json_agg(json_build_object(
+        'id', c.id,
+        'nom', c.nom,
+        'description', COALESCE(c.description, ''),
+        'article_count', COALESCE(cc.n, 0),
+        'sous_categories', COALESCE(ch.items, '[]'::json)
+    ) ORDER BY c.nom), '[]'::json)::text
+    FROM categories c
+    LEFT JOIN categorie_counts cc ON cc.categorie_id = c.id
+    LEFT JOIN children ch ON ch.categorie_id = c.id
+"""
+
+# Snapshot of the serialized tree, dropped whenever a trigger reports a write
+# to articles, categories or sous_categories. The write handlers also drop it
+# at once, so their own worker doesn't wait for the notification; it is not
+# used at all while notifications are unavailable.
+CATEGORY_TREE_TTL = float(os.getenv("CATEGORY_TREE_TTL", "300"))
+category_tree_cache = TTLCache(CATEGORY_TREE_TTL)
+
+
+def forget_category_tree(payload: Optional[str]):
+    category_tree_cache.clear()
+
+
+subscribe(DATA_CHANGES_CHANNEL, forget_category_tree)
+
 
 class CategorieCreate(BaseModel):
     nom: str
@@ -19,47 +68,66 @@ class CategorieUpdate(BaseModel):
 
 
 @router.get("/", response_model=List[Categorie])
-async def list_categories(current_user=Depends(require_permission("categories.read"))):
+async def list_categories(
+    response: Response,
+    current_user=Depends(require_permission("categories.read")),
+    etag=Depends(table_etag("categories", private=True)),
+    conn=Depends(get_db),
+):
     """Get all categories (requires categories.read permission)."""
-    conn = await connect()
-    try:
-        rows = await conn.fetch("SELECT * FROM categories ORDER BY nom")
-        return [
-            Categorie(
-                id=row["id"], nom=row["nom"], description=row["description"] or ""
-            )
-            for row in rows
-        ]
-    finally:
-        await conn.close()
+    rows = await conn.fetch(
+        "SELECT id, nom, COALESCE(description, '') AS description "
+        "FROM categories ORDER BY nom"
+    )
+    if FAST_JSON:
+        return records_response(rows, response)
+    return [
+        Categorie(id=row["id"], nom=row["nom"], description=row["description"] or "")
+        for row in rows
+    ]
+
+
+@router.get("/tree", response_model=List[CategorieTree])
+async def get_category_tree(
+    current_user=Depends(require_permission("categories.read")), conn=Depends(get_db)
+):
+    """Get categories with nested sous-categories and article counts."""
+    # Writes by other workers would go unnoticed without the listener
+    if pubsub.listen_conn is None:
+        body = (await conn.fetchval(CATEGORY_TREE_QUERY)).encode()
+        return Response(content=body, media_type="application/json")
+
+    body = category_tree_cache.get("tree")
+    if body is None:
+        generation = category_tree_cache.generation
+        body = (await conn.fetchval(CATEGORY_TREE_QUERY)).encode()
+        category_tree_cache.set("tree", body, generation)
+    return Response(content=body, media_type="application/json")
 
 
 @router.post("/", response_model=Categorie)
 async def create_category(
     category: CategorieCreate,
     current_user=Depends(require_permission("categories.create")),
+    conn=Depends(get_db),
 ):
     """Create a new category (requires categories.create permission)."""
-    conn = await connect()
-    try:
-        # Check if category already exists
-        existing = await conn.fetchrow(
-            "SELECT id FROM categories WHERE nom = $1", category.nom
-        )
-        if existing:
-            raise HTTPException(status_code=400, detail="Category already exists")
-
-        # Insert new category
-        row = await conn.fetchrow(
-            "INSERT INTO categories (nom, description) VALUES ($1, $2) RETURNING *",
-            category.nom,
-            category.description,
-        )
-        return Categorie(
-            id=row["id"], nom=row["nom"], description=row["description"] or ""
-        )
-    finally:
-        await conn.close()
+    # Check if category already exists
+    existing = await conn.fetchrow(
+        "SELECT id FROM categories WHERE nom = $1", category.nom
+    )
+    if existing:
+        raise HTTPException(status_code=400, detail="Category already exists")
+
+    # Insert new category
+    row = await conn.fetchrow(
+        "INSERT INTO categories (nom, description) VALUES ($1, $2) RETURNING *",
+        category.nom,
+        category.description,
+    )
+    category_tree_cache.clear()
+    note_local_change("categories")
+    return Categorie(id=row["id"], nom=row["nom"], description=row["description"] or "")
 
 
 @router.put("/{category_id}", response_model=Categorie)
@@ -67,80 +135,88 @@ async def update_category(
     category_id: int,
     category: CategorieUpdate,
     current_user=Depends(require_permission("categories.update")),
+    conn=Depends(get_db),
 ):
     """Update a category (requires categories.update permission)."""
-    conn = await connect()
-    try:
-        # Check if category exists
-        existing = await conn.fetchrow(
-            "SELECT * FROM categories WHERE id = $1", category_id
-        )
-        if not existing:
-            raise HTTPException(status_code=404, detail="Category not found")
-
-        # Build update query dynamically
-        updates = []
-        values = []
-        counter = 1
-
-        if category.nom is not None:
-            updates.append(f"nom = ${counter}")
-            values.append(category.nom)
-            counter += 1
-
-        if category.description is not None:
-            updates.append(f"description = ${counter}")
-            values.append(category.description)
-            counter += 1
-
-        if not updates:
-            # No changes provided
-            return Categorie(
-                id=existing["id"],
-                nom=existing["nom"],
-                description=existing["description"] or "",
-            )
-
-        # Add category_id to values
-        values.append(category_id)
-
-        query = f"UPDATE categories SET {', '.join(updates)} WHERE id = ${counter} RETURNING *"
-        row = await conn.fetchrow(query, *values)
-
+    # Check if category exists
+    existing = await conn.fetchrow(
+        "SELECT * FROM categories WHERE id = $1", category_id
+    )
+    if not existing:
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    # Build update query dynamically
+    updates = []
+    values = []
+    counter = 1
+
+    if category.nom is not None:
+        updates.append(f"nom = ${counter}")
+        values.append(category.nom)
+        counter += 1
+
+    if category.description is not None:
+        updates.append(f"description = ${counter}")
+        values.append(category.description)
+        counter += 1
+
+    if not updates:
+        # No changes provided
         return Categorie(
-            id=row["id"], nom=row["nom"], description=row["description"] or ""
+            id=existing["id"],
+            nom=existing["nom"],
+            description=existing["description"] or "",
         )
-    finally:
-        await conn.close()
+
+    # Add category_id to values
+    values.append(category_id)
+
+    query = (
+        f"UPDATE categories SET {', '.join(updates)} WHERE id = ${counter} RETURNING *"
+    )
+    row = await conn.fetchrow(query, *values)
+    category_tree_cache.clear()
+    note_local_change("categories")
+
+    return Categorie(id=row["id"], nom=row["nom"], description=row["description"] or "")
 
 
 @router.delete("/{category_id}")
 async def delete_category(
-    category_id: int, current_user=Depends(require_permission("categories.delete"))
+    category_id: int,
+    current_user=Depends(require_permission("categories.delete")),
+    conn=Depends(get_db),
 ):
     """Delete a category (requires categories.delete permission)."""
-    conn = await connect()
-    try:
-        # Check if category exists
-        existing = await conn.fetchrow(
-            "SELECT id FROM categories WHERE id = $1", category_id
+    # Check if category exists
+    existing = await conn.fetchrow(
+        "SELECT id FROM categories WHERE id = $1", category_id
+    )
+    if not existing:
+        raise HTTPException(status_code=404, detail="Category not found")
+
+    # Check if category is being used by articles
+    articles_using = await conn.fetchval(
+        "SELECT COUNT(*) FROM articles WHERE categorie_id = $1", category_id
+    )
+    if articles_using > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot delete category: {articles_using} articles are using this category",
         )
-        if not existing:
-            raise HTTPException(status_code=404, detail="Category not found")
 
-        # Check if category is being used by articles
-        articles_using = await conn.fetchval(
-            "SELECT COUNT(*) FROM articles WHERE categorie = (SELECT nom FROM categories WHERE id = $1)",
-            category_id,
+    # Check if category still has sous-categories
+    sous_categories_using = await conn.fetchval(
+        "SELECT COUNT(*) FROM sous_categories WHERE categorie_id = $1", category_id
+    )
+    if sous_categories_using > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot delete category: {sous_categories_using} sous-categories belong to this category",
         )
-        if articles_using > 0:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Cannot delete category: {articles_using} articles are using this category",
-            )
-
-        # Delete the category
-        await conn.execute("DELETE FROM categories WHERE id = $1", category_id)
-        return {"message": "Category deleted successfully"}
-    finally:
-        await conn.close()
+
+    # Delete the category
+    await conn.execute("DELETE FROM categories WHERE id = $1", category_id)
+    category_tree_cache.clear()
+    note_local_change("categories")
+    return {"message": "Category deleted successfully"}
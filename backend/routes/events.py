@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+from typing import Optional, Set
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pubsub import DATA_CHANGES_CHANNEL, subscribe
+
+router = APIRouter()
+
+# Events buffered per client; one that falls this far behind is disconnected
+# and has to resync, instead of holding memory or slowing everyone else
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "256"))
+EVENT_MAX_SUBSCRIBERS = int(os.getenv("EVENT_MAX_SUBSCRIBERS", "10000"))
+# Seconds between keep-alive comments on an idle stream
+EVENT_HEARTBEAT = 15
+# Milliseconds browsers wait before reconnecting a closed stream
+EVENT_RETRY = 3000
+
+# Tells a client's stream to end after it was evicted
+EVICTED = object()
+
+# Client queues of this worker, all fed by its single LISTEN connection
+subscribers: Set[asyncio.Queue] = set()
+
+
+def format_event(payload: Optional[str]) -> bytes:
+    if payload is None:
+        # Notifications may have been lost: clients must reload
+        return b"event: resync\ndata: {}\n\n"
+
+    change = json.loads(payload)
+    lines = []
+    if change["rows"]:
+        lines.append(f"id: {max(version for _, version in change['rows'])}")
+    lines.append("event: change")
+    lines.append(f"data: {json.dumps(change, separators=(',', ':'))}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def evict(queue: asyncio.Queue):
+    subscribers.discard(queue)
+    # Make room for the marker that ends the stream
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(EVICTED)
+
+
+def broadcast(payload: Optional[str]):
+    # Encoded once, shared by every client
+    event = format_event(payload)
+    for queue in list(subscribers):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            evict(queue)
+
+
+subscribe(DATA_CHANGES_CHANNEL, broadcast)
+
+
+async def event_stream(queue: asyncio.Queue, resumed: bool = False):
+    try:
+        yield f"retry: {EVENT_RETRY}\n\n".encode()
+        if resumed:
+            # Changes made while the client was away were never queued for it
+            yield b"event: resync\ndata: {}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENT_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            if event is EVICTED:
+                yield b"event: resync\ndata: {}\n\n"
+                return
+            yield event
+    finally:
+        subscribers.discard(queue)
+
+
+@router.get("/")
+async def stream_events(request: Request):
+    """Server-Sent Events feed of changes to articles and categories.
+
+    Each ``change`` event carries the table, the operation and the
+    [id, row_version] pairs it touched (``rows`` is null when the statement
+    was too large to list; reload that table). A ``resync`` event means
+    changes may have been missed; it is also the first event of a stream
+    reopened with ``Last-Event-ID``.
+    """
+    if len(subscribers) >= EVENT_MAX_SUBSCRIBERS:
+        raise HTTPException(status_code=503, detail="Too many event subscribers")
+
+    queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+    subscribers.add(queue)
+    return StreamingResponse(
+        event_stream(queue, "last-event-id" in request.headers),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,12 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Response
 from typing import List, Optional
-from database import connect
+from database import get_db
 from models import SousCategorie
+from routes.categories import category_tree_cache
+from responses import FAST_JSON, records_response
 from auth import get_current_active_user_with_role, require_permission
+from conditional import note_local_change, table_etag
 from pydantic import BaseModel
 
 router = APIRouter()
 
+# Sous-categories reference their parent by id; the API keeps exposing the
+# parent's name, read through this join.
+SOUS_CATEGORIE_SELECT = """
+    SELECT sc.id, sc.nom, COALESCE(sc.description, '') AS description,
+           sc.categorie_id, c.nom AS categorie
+    FROM sous_categories sc
+    JOIN categories c ON c.id = sc.categorie_id
+"""
+
 
 class SousCategorieCreate(BaseModel):
     nom: str
@@ -22,64 +34,71 @@ class SousCategorieUpdate(BaseModel):
 
 @router.get("/", response_model=List[SousCategorie])
 async def list_sous_categories(
+    response: Response,
     current_user=Depends(require_permission("categories.read")),
+    etag=Depends(table_etag("sous_categories", "categories", private=True)),
+    conn=Depends(get_db),
 ):
     """Get all sous-categories (requires categories.read permission)."""
-    conn = await connect()
-    try:
-        rows = await conn.fetch("SELECT * FROM sous_categories ORDER BY nom")
-        return [
-            SousCategorie(
-                id=row["id"],
-                nom=row["nom"],
-                description=row["description"] or "",
-                categorie=row["categorie"],
-            )
-            for row in rows
-        ]
-    finally:
-        await conn.close()
+    rows = await conn.fetch(f"{SOUS_CATEGORIE_SELECT} ORDER BY sc.nom")
+    if FAST_JSON:
+        return records_response(rows, response)
+    return [
+        SousCategorie(
+            id=row["id"],
+            nom=row["nom"],
+            description=row["description"] or "",
+            categorie=row["categorie"],
+            categorie_id=row["categorie_id"],
+        )
+        for row in rows
+    ]
 
 
 @router.post("/", response_model=SousCategorie)
 async def create_sous_category(
     sous_category: SousCategorieCreate,
     current_user=Depends(require_permission("categories.create")),
+    conn=Depends(get_db),
 ):
     """Create a new sous-category (requires categories.create permission)."""
-    conn = await connect()
-    try:
-        # Check if sous-category already exists
-        existing = await conn.fetchrow(
-            "SELECT id FROM sous_categories WHERE nom = $1", sous_category.nom
+    # Check if sous-category already exists
+    existing = await conn.fetchrow(
+        "SELECT id FROM sous_categories WHERE nom = $1", sous_category.nom
+    )
+    if existing:
+        raise HTTPException(status_code=400, detail="Sous-category already exists")
+
+    # Verify that the parent category exists
+    category_exists = await conn.fetchrow(
+        "SELECT id FROM categories WHERE nom = $1", sous_category.categorie
+    )
+    if not category_exists:
+        raise HTTPException(status_code=400, detail="Parent category does not exist")
+
+    # Insert new sous-category
+    row = await conn.fetchrow(
+        """
+        WITH sc AS (
+            INSERT INTO sous_categories (nom, description, categorie_id)
+            VALUES ($1, $2, $3) RETURNING *
         )
-        if existing:
-            raise HTTPException(status_code=400, detail="Sous-category already exists")
-
-        # Verify that the parent category exists
-        category_exists = await conn.fetchrow(
-            "SELECT id FROM categories WHERE nom = $1", sous_category.categorie
-        )
-        if not category_exists:
-            raise HTTPException(
-                status_code=400, detail="Parent category does not exist"
-            )
-
-        # Insert new sous-category
-        row = await conn.fetchrow(
-            "INSERT INTO sous_categories (nom, description, categorie) VALUES ($1, $2, $3) RETURNING *",
-            sous_category.nom,
-            sous_category.description,
-            sous_category.categorie,
-        )
-        return SousCategorie(
-            id=row["id"],
-            nom=row["nom"],
-            description=row["description"] or "",
-            categorie=row["categorie"],
-        )
-    finally:
-        await conn.close()
+        SELECT sc.*, c.nom AS categorie
+        FROM sc JOIN categories c ON c.id = sc.categorie_id
+        """,
+        sous_category.nom,
+        sous_category.description,
+        category_exists["id"],
+    )
+    category_tree_cache.clear()
+    note_local_change("sous_categories")
+    return SousCategorie(
+        id=row["id"],
+        nom=row["nom"],
+        description=row["description"] or "",
+        categorie=row["categorie"],
+        categorie_id=row["categorie_id"],
+    )
 
 
 @router.put("/{sous_category_id}", response_model=SousCategorie)
@@ -87,100 +106,105 @@ async def update_sous_category(
     sous_category_id: int,
     sous_category: SousCategorieUpdate,
     current_user=Depends(require_permission("categories.update")),
+    conn=Depends(get_db),
 ):
     """Update a sous-category (requires categories.update permission)."""
-    conn = await connect()
-    try:
-        # Check if sous-category exists
-        existing = await conn.fetchrow(
-            "SELECT * FROM sous_categories WHERE id = $1", sous_category_id
+    # Check if sous-category exists
+    existing = await conn.fetchrow(
+        f"{SOUS_CATEGORIE_SELECT} WHERE sc.id = $1", sous_category_id
+    )
+    if not existing:
+        raise HTTPException(status_code=404, detail="Sous-category not found")
+
+    # Build update query dynamically
+    updates = []
+    values = []
+    counter = 1
+
+    if sous_category.nom is not None:
+        updates.append(f"nom = ${counter}")
+        values.append(sous_category.nom)
+        counter += 1
+
+    if sous_category.description is not None:
+        updates.append(f"description = ${counter}")
+        values.append(sous_category.description)
+        counter += 1
+
+    if sous_category.categorie is not None:
+        # Verify that the parent category exists
+        category_exists = await conn.fetchrow(
+            "SELECT id FROM categories WHERE nom = $1", sous_category.categorie
         )
-        if not existing:
-            raise HTTPException(status_code=404, detail="Sous-category not found")
-
-        # Build update query dynamically
-        updates = []
-        values = []
-        counter = 1
-
-        if sous_category.nom is not None:
-            updates.append(f"nom = ${counter}")
-            values.append(sous_category.nom)
-            counter += 1
-
-        if sous_category.description is not None:
-            updates.append(f"description = ${counter}")
-            values.append(sous_category.description)
-            counter += 1
-
-        if sous_category.categorie is not None:
-            # Verify that the parent category exists
-            category_exists = await conn.fetchrow(
-                "SELECT id FROM categories WHERE nom = $1", sous_category.categorie
-            )
-            if not category_exists:
-                raise HTTPException(
-                    status_code=400, detail="Parent category does not exist"
-                )
-
-            updates.append(f"categorie = ${counter}")
-            values.append(sous_category.categorie)
-            counter += 1
-
-        if not updates:
-            # No changes provided
-            return SousCategorie(
-                id=existing["id"],
-                nom=existing["nom"],
-                description=existing["description"] or "",
-                categorie=existing["categorie"],
+        if not category_exists:
+            raise HTTPException(
+                status_code=400, detail="Parent category does not exist"
             )
 
-        # Add sous_category_id to values
-        values.append(sous_category_id)
-
-        query = f"UPDATE sous_categories SET {', '.join(updates)} WHERE id = ${counter} RETURNING *"
-        row = await conn.fetchrow(query, *values)
+        updates.append(f"categorie_id = ${counter}")
+        values.append(category_exists["id"])
+        counter += 1
 
+    if not updates:
+        # No changes provided
         return SousCategorie(
-            id=row["id"],
-            nom=row["nom"],
-            description=row["description"] or "",
-            categorie=row["categorie"],
+            id=existing["id"],
+            nom=existing["nom"],
+            description=existing["description"] or "",
+            categorie=existing["categorie"],
+            categorie_id=existing["categorie_id"],
+        )
+
+    # Add sous_category_id to values
+    values.append(sous_category_id)
+
+    query = f"""
+        WITH sc AS (
+            UPDATE sous_categories SET {', '.join(updates)} WHERE id = ${counter}
+            RETURNING *
         )
-    finally:
-        await conn.close()
+        SELECT sc.*, c.nom AS categorie
+        FROM sc JOIN categories c ON c.id = sc.categorie_id
+    """
+    row = await conn.fetchrow(query, *values)
+    category_tree_cache.clear()
+    note_local_change("sous_categories")
+
+    return SousCategorie(
+        id=row["id"],
+        nom=row["nom"],
+        description=row["description"] or "",
+        categorie=row["categorie"],
+        categorie_id=row["categorie_id"],
+    )
 
 
 @router.delete("/{sous_category_id}")
 async def delete_sous_category(
-    sous_category_id: int, current_user=Depends(require_permission("categories.delete"))
+    sous_category_id: int,
+    current_user=Depends(require_permission("categories.delete")),
+    conn=Depends(get_db),
 ):
     """Delete a sous-category (requires categories.delete permission)."""
-    conn = await connect()
-    try:
-        # Check if sous-category exists
-        existing = await conn.fetchrow(
-            "SELECT id FROM sous_categories WHERE id = $1", sous_category_id
+    # Check if sous-category exists
+    existing = await conn.fetchrow(
+        "SELECT id FROM sous_categories WHERE id = $1", sous_category_id
+    )
+    if not existing:
+        raise HTTPException(status_code=404, detail="Sous-category not found")
+
+    # Check if sous-category is being used by articles
+    articles_using = await conn.fetchval(
+        "SELECT COUNT(*) FROM articles WHERE sous_categorie_id = $1", sous_category_id
+    )
+    if articles_using > 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cannot delete sous-category: {articles_using} articles are using this sous-category",
         )
-        if not existing:
-            raise HTTPException(status_code=404, detail="Sous-category not found")
 
-        # Check if sous-category is being used by articles
-        articles_using = await conn.fetchval(
-            "SELECT COUNT(*) FROM articles WHERE sous_categorie = (SELECT nom FROM sous_categories WHERE id = $1)",
-            sous_category_id,
-        )
-        if articles_using > 0:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Cannot delete sous-category: {articles_using} articles are using this sous-category",
-            )
-
-        # Delete the sous-category
-        await conn.execute(
-            "DELETE FROM sous_categories WHERE id = $1", sous_category_id
-        )
-        return {"message": "Sous-category deleted successfully"}
-    finally:
-        await conn.close()
+    # Delete the sous-category
+    await conn.execute("DELETE FROM sous_categories WHERE id = $1", sous_category_id)
+    category_tree_cache.clear()
+    note_local_change("sous_categories")
+    return {"message": "Sous-category deleted successfully"}
@@ -0,0 +1,114 @@
+import os
+from fastapi import APIRouter, Depends, Query
+from auth import require_permission
+from database import get_db
+from models import SyncChanges
+from routes.articles import ARTICLE_COLUMNS, ARTICLE_FROM
+from routes.sous_categories import SOUS_CATEGORIE_SELECT
+
+router = APIRouter()
+
+# Changes returned by one sync at most; past that a full reload is about as
+# cheap, so the client is told to reset instead
+SYNC_MAX_CHANGES = int(os.getenv("SYNC_MAX_CHANGES", "5000"))
+
+# Rows written by transactions at or after the watermark ($1), per table.
+# Articles and sous-categories carry their parents' names, so they are sent
+# again when a parent changed (e.g. was renamed). Each branch of the changed
+# set is an indexed lookup (row_xid, or the parent id); names are joined on
+# afterwards.
+SYNC_QUERIES = {
+    "articles": f"""
+        SELECT {ARTICLE_COLUMNS} {ARTICLE_FROM}
+        WHERE a.id IN (
+            SELECT id FROM articles WHERE row_xid >= $1::text::xid8
+            UNION
+            SELECT id FROM articles WHERE categorie_id IN (
+                SELECT id FROM categories WHERE row_xid >= $1::text::xid8
+            )
+            UNION
+            SELECT id FROM articles WHERE sous_categorie_id IN (
+                SELECT id FROM sous_categories WHERE row_xid >= $1::text::xid8
+            )
+        )
+        ORDER BY a.row_version
+        LIMIT $2
+    """,
+    "categories": """
+        SELECT id, nom, COALESCE(description, '') AS description
+        FROM categories
+        WHERE row_xid >= $1::text::xid8
+        ORDER BY row_version
+        LIMIT $2
+    """,
+    "sous_categories": f"""
+        {SOUS_CATEGORIE_SELECT}
+        WHERE sc.id IN (
+            SELECT id FROM sous_categories WHERE row_xid >= $1::text::xid8
+            UNION
+            SELECT id FROM sous_categories WHERE categorie_id IN (
+                SELECT id FROM categories WHERE row_xid >= $1::text::xid8
+            )
+        )
+        ORDER BY sc.row_version
+        LIMIT $2
+    """,
+    "deleted": """
+        SELECT table_name, row_id FROM tombstones
+        WHERE row_xid >= $1::text::xid8
+        ORDER BY row_version
+        LIMIT $2
+    """,
+}
+
+
+@router.get("/", response_model=SyncChanges)
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    current_user=Depends(require_permission("categories.read")),
+    conn=Depends(get_db),
+):
+    """Changes to articles and categories since a previous sync.
+
+    Pass the ``version`` of the last response as ``since`` (0 the first time).
+    Rows may come back more than once, so apply them as upserts. When
+    ``reset`` is true the changes were too many to list (or a table was
+    truncated): reload everything, then sync from the returned version.
+    """
+    # One snapshot for the watermark and every read, so nothing committed
+    # between the queries is skipped or half seen
+    async with conn.transaction(isolation="repeatable_read", readonly=True):
+        # Transactions below the snapshot's horizon have all finished; those
+        # at or above it are picked up again by the next sync
+        version = await conn.fetchval(
+            "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+        )
+        since_xid = str(since)
+        reset = await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM sync_resets WHERE row_xid >= $1::text::xid8)",
+            since_xid,
+        )
+
+        rows = {}
+        remaining = SYNC_MAX_CHANGES
+        for key, query in SYNC_QUERIES.items():
+            if reset:
+                break
+            # One extra row tells us the budget was exceeded
+            rows[key] = await conn.fetch(query, since_xid, remaining + 1)
+            remaining -= len(rows[key])
+            reset = remaining < 0
+
+    if reset:
+        return {"version": version, "reset": True}
+
+    deleted = {"articles": [], "categories": [], "sous_categories": []}
+    for row in rows.pop("deleted"):
+        deleted[row["table_name"]].append(row["row_id"])
+    return {
+        "version": version,
+        "articles": [dict(r) for r in rows["articles"]],
+        "categories": [dict(r) for r in rows["categories"]],
+        "sous_categories": [dict(r) for r in rows["sous_categories"]],
+        "deleted": deleted,
+    }
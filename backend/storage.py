@@ -0,0 +1,217 @@
+import glob
+import hashlib
+import os
+import tempfile
+from typing import Iterable, Optional
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+# Attachment storage configuration
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Room for the other form fields and multipart framing around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Partial uploads live here until complete; same filesystem as UPLOAD_DIR so
+# the final rename is atomic
+TMP_DIR = os.path.join(UPLOAD_DIR, ".tmp")
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File exceeds the maximum size of {MAX_UPLOAD_SIZE} bytes",
+    )
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_chunk(out, digest, chunk: bytes):
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _move_into_store(tmp_path: str, sha256: str):
+    path = attachment_path(sha256)
+    if os.path.exists(path):
+        # Same content is already stored
+        os.remove(tmp_path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+
+
+def _remove_stored(sha256: str):
+    path = attachment_path(sha256)
+    # Derived files (thumbnails) are named after the file they come from
+    for derived in glob.glob(glob.escape(path) + ".*"):
+        _remove_quietly(derived)
+    _remove_quietly(path)
+
+
+class UploadSizeLimitMiddleware:
+    """Refuse upload bodies that can't fit MAX_UPLOAD_SIZE before they are read.
+
+    Starlette spools the whole multipart body to disk before a route runs, so
+    the check in save_upload alone would not bound what the server accepts.
+    Requests to ``paths`` are rejected on their Content-Length, and bodies
+    sent without one are cut off once they grow past the limit.
+    """
+
+    def __init__(self, app, paths: Iterable[str]):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_body = MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if (
+            content_length is not None
+            and content_length.isdigit()
+            and (int(content_length) > self.max_body)
+        ):
+            error = _too_large()
+            response = JSONResponse({"detail": error.detail}, error.status_code)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    raise _too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def attachment_path(sha256: str) -> str:
+    """Path of a stored file, sharded by the first bytes of its hash."""
+    return os.path.join(UPLOAD_DIR, sha256[:2], sha256[2:4], sha256)
+
+
+def legacy_upload_path(filename: str) -> Optional[str]:
+    """Path of a file saved by name before the content-addressed store."""
+    path = os.path.join(UPLOAD_DIR, os.path.basename(filename))
+    return path if os.path.isfile(path) else None
+
+
+async def save_upload(file: UploadFile) -> dict:
+    """Stream an upload to a temporary file, hashing it on the way.
+
+    The file is written chunk by chunk from a worker thread. It only enters
+    the content-addressed store in add_attachment_reference, and should be
+    passed to discard_upload once the request is done with it.
+    The file itself is held to MAX_UPLOAD_SIZE here; UploadSizeLimitMiddleware
+    bounds the request body before it is spooled.
+    """
+    filename = os.path.basename(file.filename or "")
+    if filename in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid file name")
+    if file.size is not None and file.size > MAX_UPLOAD_SIZE:
+        raise _too_large()
+
+    await run_in_threadpool(os.makedirs, TMP_DIR, exist_ok=True)
+    fd, tmp_path = await run_in_threadpool(tempfile.mkstemp, dir=TMP_DIR)
+    try:
+        size = 0
+        digest = hashlib.sha256()
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise _too_large()
+                await run_in_threadpool(_write_chunk, out, digest, chunk)
+        sha256 = digest.hexdigest()
+    except BaseException:
+        await run_in_threadpool(_remove_quietly, tmp_path)
+        raise
+
+    return {
+        "sha256": sha256,
+        "size": size,
+        "content_type": file.content_type,
+        "filename": filename,
+        "tmp_path": tmp_path,
+    }
+
+
+async def discard_upload(stored: dict):
+    """Remove an upload's temporary file if it never entered the store."""
+    await run_in_threadpool(_remove_quietly, stored["tmp_path"])
+
+
+async def lock_stored_file(conn, sha256: str):
+    """Serialize work on one stored file until the transaction ends.
+
+    Recording a reference and deleting an unreferenced file both hold it, so
+    a file is never removed under an upload that is about to reference it.
+    """
+    await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", sha256)
+
+
+async def add_attachment_reference(conn, stored: dict) -> int:
+    """Store an upload and record one more article using it; call inside a
+    transaction. Returns the attachment id.
+
+    The file is renamed to its SHA-256 path (a half-written file is never
+    visible) unless the same content is already stored.
+    """
+    await lock_stored_file(conn, stored["sha256"])
+    await run_in_threadpool(_move_into_store, stored["tmp_path"], stored["sha256"])
+    return await conn.fetchval(
+        """
+        INSERT INTO attachments (sha256, size, content_type, ref_count)
+        VALUES ($1, $2, $3, 1)
+        ON CONFLICT (sha256) DO UPDATE SET ref_count = attachments.ref_count + 1
+        RETURNING id
+        """,
+        stored["sha256"],
+        stored["size"],
+        stored["content_type"],
+    )
+
+
+async def release_attachment(conn, attachment_id: int) -> Optional[str]:
+    """Drop one reference to an attachment; call inside a transaction.
+
+    Returns the hash of the file once nothing references it any more, for
+    the caller to pass to delete_unreferenced_file after committing.
+    """
+    row = await conn.fetchrow(
+        """
+        UPDATE attachments SET ref_count = ref_count - 1
+        WHERE id = $1
+        RETURNING sha256, ref_count
+        """,
+        attachment_id,
+    )
+    if row and row["ref_count"] <= 0:
+        await conn.execute("DELETE FROM attachments WHERE id = $1", attachment_id)
+        return row["sha256"]
+    return None
+
+
+async def delete_unreferenced_file(conn, sha256: str):
+    """Remove a stored file, unless a concurrent upload re-registered it."""
+    async with conn.transaction():
+        await lock_stored_file(conn, sha256)
+        if await conn.fetchval("SELECT 1 FROM attachments WHERE sha256 = $1", sha256):
+            return
+        await run_in_threadpool(_remove_stored, sha256)
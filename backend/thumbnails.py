@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional
+from fastapi.concurrency import run_in_threadpool
+from storage import attachment_path
+
+logger = logging.getLogger(__name__)
+
+# Thumbnail configuration
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "256"))
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "webp").lower()
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+# Decoding and resizing is CPU bound, so it runs in worker processes rather
+# than on the event loop or in the GIL-bound thread pool
+executor: Optional[ProcessPoolExecutor] = None
+
+# Renders in progress, so concurrent requests for one file share the work
+pending: Dict[str, asyncio.Future] = {}
+
+
+def start_thumbnail_pool():
+    """Start the worker processes used to render thumbnails."""
+    global executor
+    if THUMBNAIL_FORMAT not in THUMBNAIL_MEDIA_TYPES:
+        raise ValueError(f"Unsupported THUMBNAIL_FORMAT: {THUMBNAIL_FORMAT}")
+    # Forking a process that already runs an event loop and threads is unsafe
+    executor = ProcessPoolExecutor(
+        max_workers=THUMBNAIL_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def stop_thumbnail_pool():
+    """Stop the thumbnail workers, dropping renders that have not started."""
+    global executor
+    if executor is not None:
+        executor.shutdown(cancel_futures=True)
+        executor = None
+
+
+def can_thumbnail(content_type: Optional[str]) -> bool:
+    return bool(content_type) and (
+        content_type.startswith("image/") or content_type == "application/pdf"
+    )
+
+
+def thumbnail_path(sha256: str) -> str:
+    """Path of a file's thumbnail, stored beside it.
+
+    The size and format are part of the name, so changing the configuration
+    renders new thumbnails instead of serving stale ones.
+    """
+    return f"{attachment_path(sha256)}.{THUMBNAIL_SIZE}.{THUMBNAIL_FORMAT}"
+
+
+def render_thumbnail(
+    source: str, target: str, content_type: str, size: int, format: str
+):
+    """Render a thumbnail of an image or of a PDF's first page (in a worker)."""
+    from PIL import Image, ImageOps
+
+    if content_type == "application/pdf":
+        import pymupdf
+
+        with pymupdf.open(source) as document:
+            page = document[0]
+            # Rasterize just large enough for the thumbnail
+            zoom = size / max(page.rect.width, page.rect.height, 1)
+            pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+            image = Image.frombytes(
+                "RGB", (pixmap.width, pixmap.height), pixmap.samples
+            )
+    else:
+        image = Image.open(source)
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+
+    image.thumbnail((size, size))
+    if format == "jpeg" or image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if format == "webp" else "RGB")
+
+    # Write next to the target and rename, so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+    try:
+        with os.fdopen(fd, "wb") as out:
+            image.save(out, format=format.upper(), quality=80)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+async def ensure_thumbnail(sha256: str, content_type: Optional[str]) -> Optional[str]:
+    """Return the thumbnail of a stored file, rendering it if needed.
+
+    Returns None when the file type has no preview or rendering fails.
+    """
+    if not can_thumbnail(content_type):
+        return None
+    target = thumbnail_path(sha256)
+    if await run_in_threadpool(os.path.isfile, target):
+        return target
+
+    future = pending.get(target)
+    pool = executor
+    try:
+        if future is None:
+            # Without a started pool (e.g. in scripts) this uses the thread pool
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                pool,
+                render_thumbnail,
+                attachment_path(sha256),
+                target,
+                content_type,
+                THUMBNAIL_SIZE,
+                THUMBNAIL_FORMAT,
+            )
+            pending[target] = future
+            future.add_done_callback(lambda _: pending.pop(target, None))
+        await asyncio.shield(future)
+    except BrokenProcessPool:
+        # A worker died (e.g. a decoder crash on a malformed file); replace
+        # the pool so later renders keep working
+        logger.exception("Thumbnail worker died while rendering %s", sha256)
+        if pool is not None and pool is executor:
+            stop_thumbnail_pool()
+            start_thumbnail_pool()
+        return None
+    except Exception:
+        logger.exception("Could not render a thumbnail for %s", sha256)
+        return None
+    return target
@@ -65,16 +65,27 @@ export async function getCurrentUser(token: string): Promise<UserWithRole> {
 
 // User Management API functions
 export async function getAllUsers(token: string): Promise<UserWithRole[]> {
-  const res = await fetch(`${BASE_URL}/api/auth/users`, {
-    headers: getAuthHeaders(token)
-  });
-
-  if (!res.ok) {
-    const errorData = await res.json();
-    throw new Error(errorData.detail || `HTTP error! status: ${res.status}`);
-  }
-
-  return res.json();
+  // The users endpoint is keyset-paginated: follow X-Next-Cursor until the last page
+  const users: UserWithRole[] = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ limit: "1000" });
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+    const res = await fetch(`${BASE_URL}/api/auth/users?${params}`, {
+      headers: getAuthHeaders(token)
+    });
+
+    if (!res.ok) {
+      const errorData = await res.json();
+      throw new Error(errorData.detail || `HTTP error! status: ${res.status}`);
+    }
+
+    users.push(...(await res.json()));
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return users;
 }
 
 export async function updateUser(userId: number, userData: UserUpdate, token: string): Promise<UserWithRole> {
@@ -176,14 +187,29 @@ export async function checkPermission(permissionCheck: PermissionCheck, token: s
 }
 
 // Article API functions (existing - keeping for compatibility)
-export async function getArticles(token?: string) {
-  const res = await fetch(`${BASE_URL}/api/articles`, {
-    headers: token ? getAuthHeaders(token) : {}
-  });
-  if (!res.ok) {
-    throw new Error(`HTTP error! status: ${res.status}`);
-  }
-  return res.json();
+// `fields` limits the columns returned (e.g. ["titre", "prix", "categorie"])
+export async function getArticles(token?: string, fields?: string[]) {
+  // The list endpoint is keyset-paginated: follow X-Next-Cursor until the last page
+  const articles = [];
+  let cursor: string | null = null;
+  do {
+    const params = new URLSearchParams({ limit: "1000" });
+    if (fields) {
+      params.set("fields", fields.join(","));
+    }
+    if (cursor) {
+      params.set("cursor", cursor);
+    }
+    const res = await fetch(`${BASE_URL}/api/articles/?${params}`, {
+      headers: token ? getAuthHeaders(token) : {}
+    });
+    if (!res.ok) {
+      throw new Error(`HTTP error! status: ${res.status}`);
+    }
+    articles.push(...(await res.json()));
+    cursor = res.headers.get("X-Next-Cursor");
+  } while (cursor);
+  return articles;
 }
 
 export async function getArticle(id) {
@@ -249,6 +275,17 @@ export async function getCategories(token?: string) {
   return res.json();
 }
 
+// Categories with their sous-categories and article counts, in one call
+export async function getCategoryTree(token?: string) {
+  const res = await fetch(`${BASE_URL}/api/categories/tree`, {
+    headers: token ? getAuthHeaders(token) : {}
+  });
+  if (!res.ok) {
+    throw new Error(`HTTP error! status: ${res.status}`);
+  }
+  return res.json();
+}
+
 export async function createCategory(nom: string, description: string = "", token: string) {
   const res = await fetch(`${BASE_URL}/api/categories/`, {
     method: "POST",
@@ -334,3 +371,28 @@ export async function deleteSousCategorie(id: number, token: string) {
   }
   return res.json();
 }
+
+// Changes since a previous sync (pass its `version`; 0 the first time).
+// Changed rows are upserts and `deleted` lists removed ids per table; when
+// `reset` is true, reload everything and keep the returned version.
+export async function syncChanges(since: number, token: string) {
+  const res = await fetch(`${BASE_URL}/api/sync/?since=${since}`, {
+    headers: getAuthHeaders(token)
+  });
+  if (!res.ok) {
+    throw new Error(`HTTP error! status: ${res.status}`);
+  }
+  return res.json();
+}
+
+// Server-Sent Events feed of article/category changes. `change` events carry
+// the table, operation and [id, row_version] pairs; `resync` means reload.
+export function subscribeToChanges(
+  onChange: (change: { table: string; op: string; rows: [number, number][] | null }) => void,
+  onResync: () => void
+): () => void {
+  const source = new EventSource(`${BASE_URL}/api/events/`);
+  source.addEventListener("change", (event) => onChange(JSON.parse((event as MessageEvent).data)));
+  source.addEventListener("resync", () => onResync());
+  return () => source.close();
+}